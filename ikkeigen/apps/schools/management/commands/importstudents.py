@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from schools.models import School
+from schools.utils import ROSTER_CHUNK_SIZE, importRoster, iterRosterRows
+
+
+class Command(BaseCommand):
+    help = "Imports a roster of students from a CSV or JSONL file to a school"
+
+    def add_arguments(self, parser):
+        parser.add_argument("schoolUuid", help="Uuid of the school")
+        parser.add_argument("path", help="Path to the .csv or .jsonl roster")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ROSTER_CHUNK_SIZE,
+            help="Number of students written per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Read and validate the file without writing anything",
+        )
+
+    def handle(self, *args, **options):
+        school = School.objects.filter(
+            uuid=options["schoolUuid"], deletedAt__isnull=True
+        ).first()
+        if not school:
+            raise CommandError(f"No school with uuid {options['schoolUuid']}")
+
+        path = options["path"]
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                result = importRoster(
+                    school,
+                    iterRosterRows(file, path),
+                    chunkSize=options["chunk_size"],
+                    dryRun=options["dry_run"],
+                )
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        for error in result["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+
+        self.stdout.write(
+            f"{result['created']} students created, {result['linked']} existing "
+            f"users linked, {len(result['errors'])} rows skipped"
+            + (" (dry run)" if options["dry_run"] else "")
+        )
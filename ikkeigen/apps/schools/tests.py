@@ -1,3 +1,119 @@
-from django.test import TestCase
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from users.models import OutgoingEmail, User
+from users.utils import createJwtToken
 
-# Create your tests here.
+from .models import School
+from .utils import importRosterChunk, searchEducations
+
+
+class AddTeachersToSchoolTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name="Skolen", address="Skolevej 1")
+        self.teacher = User.objects.create(
+            email="laerer@skolen.dk", isActive=True, role="teacher-admin"
+        )
+        self.school.teachers.add(self.teacher)
+        token = Token.objects.create(user=self.teacher)
+        self.headers = {
+            "HTTP_AUTHORIZATION": f"Token {createJwtToken(self.teacher, token)}"
+        }
+
+    @override_settings(EMAIL_OUTBOX_BATCH_SIZE=10)
+    def test_every_invite_is_sent_eagerly(self):
+        emails = [f"laerer{index}@skolen.dk" for index in range(25)]
+
+        response = self.client.post(
+            reverse("schools:add_teachers_to_school"),
+            {"emails": emails},
+            content_type="application/json",
+            **self.headers,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertFalse(OutgoingEmail.objects.filter(status="pending").exists())
+
+
+class ImportRosterTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name="Skolen", address="Skolevej 1")
+
+    def test_imported_student_cannot_be_verified(self):
+        importRosterChunk(self.school, [(2, {"email": "elev@skolen.dk"})])
+        student = User.objects.get(email="elev@skolen.dk")
+
+        response = self.client.post(
+            reverse("user:verify_user_view", kwargs={"userUuid": student.uuid.hex}),
+            {"verifyCode": ""},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        student.refresh_from_db()
+        self.assertFalse(student.isActive)
+
+    def test_student_from_another_school_is_not_moved(self):
+        otherSchool = School.objects.create(name="Anden Skole", address="Skolevej 2")
+        student = User.objects.create(email="elev@skolen.dk", isActive=True)
+        otherSchool.students.add(student)
+
+        result = importRosterChunk(self.school, [(2, {"email": "Elev@skolen.dk"})])
+
+        self.assertEqual(result["linked"], 0)
+        self.assertEqual(
+            result["errors"],
+            [{"row": 2, "error": "Brugeren er allerede elev på en anden skole."}],
+        )
+        self.assertFalse(self.school.students.filter(id=student.id).exists())
+
+    def signUp(self, password):
+        return self.client.post(
+            reverse("user:signup_view"),
+            {"email": "elev@skolen.dk", "password": password, "password2": password},
+            content_type="application/json",
+        )
+
+    def test_sign_up_hides_roster_details_until_verified(self):
+        importRosterChunk(
+            self.school,
+            [
+                (
+                    2,
+                    {
+                        "email": "elev@skolen.dk",
+                        "firstName": "Anna",
+                        "lastName": "Hansen",
+                    },
+                )
+            ],
+        )
+
+        response = self.signUp("hemmelig1")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["firstName"], "")
+        self.assertEqual(response.data["lastName"], "")
+        self.assertIsNone(response.data["schoolName"])
+
+    def test_later_sign_up_replaces_unverified_password(self):
+        importRosterChunk(self.school, [(2, {"email": "elev@skolen.dk"})])
+        self.signUp("fremmed1")
+
+        response = self.signUp("hemmelig1")
+
+        self.assertEqual(response.status_code, 201)
+        student = User.objects.get(email="elev@skolen.dk")
+        self.assertTrue(student.check_password("hemmelig1"))
+
+
+class SearchEducationsTests(TestCase):
+    def test_danish_letters_are_not_read_as_plain_vowels(self):
+        self.assertEqual(searchEducations("tøm"), ["Tømrer"])
+        self.assertNotIn("Automatiktekniker", searchEducations("ø"))
+
+    def test_plain_vowels_find_danish_letters(self):
+        self.assertEqual(searchEducations("tomrer"), ["Tømrer"])
+        self.assertEqual(searchEducations("stoeberi"), searchEducations("støberi"))
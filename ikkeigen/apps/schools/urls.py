@@ -34,6 +34,14 @@ def get_urls():
         )
     )
 
+    urls.append(
+        re_path(
+            r"^my-school/students/import/$",
+            views.ImportStudentsView.as_view(),
+            name="import_students",
+        )
+    )
+
     urls.append(
         re_path(
             r"^add-teacher/$",
@@ -42,6 +50,14 @@ def get_urls():
         )
     )
 
+    urls.append(
+        re_path(
+            r"^add-teachers/$",
+            views.AddTeachersToSchool.as_view(),
+            name="add_teachers_to_school",
+        )
+    )
+
     urls.append(
         re_path(
             r"^teachers/(?P<userUuid>\w+)/remove/$",
@@ -0,0 +1,322 @@
+import csv
+import hashlib
+import io
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from users.models import User
+
+from .constants import EDUCATION_TYPES
+from .models import School
+
+EMAIL_SEPARATORS = re.compile(r"[\s,;]+")
+
+ROSTER_CHUNK_SIZE = 500
+
+NON_WORD_CHARACTERS = re.compile(r"[^a-z0-9]+")
+# Danish letters are folded both ways, so "støberi", "stoeberi" and
+# "stoberi" all find Støberitekniker. The loose folding is only used for
+# searches without Danish letters, "tøm" shouldn't find "automatik".
+DANISH_FOLDINGS = (
+    {"æ": "ae", "ø": "oe", "å": "aa"},
+    {"æ": "ae", "ø": "o", "å": "a"},
+)
+
+
+def parseEmailList(emails=None, csvFile=None) -> tuple:
+    """
+    Reads emails from a list, a string separated by commas, semicolons or
+    whitespace, and/or an uploaded CSV file where every cell is an email.
+    Returns the valid emails lowercased without duplicates, in the order they
+    were given, and the invalid ones.
+    """
+    values = []
+    if isinstance(emails, str):
+        values += EMAIL_SEPARATORS.split(emails)
+    elif isinstance(emails, (list, tuple)):
+        values += [str(email) for email in emails]
+
+    if csvFile is not None:
+        content = io.TextIOWrapper(csvFile, encoding="utf-8-sig")
+        for row in csv.reader(content):
+            values += row
+
+    validEmails = {}
+    invalidEmails = []
+    for value in values:
+        email = value.strip().lower()
+        if not email:
+            continue
+        try:
+            validate_email(email)
+        except ValidationError:
+            invalidEmails.append(value.strip())
+            continue
+        validEmails.setdefault(email, None)
+
+    return list(validEmails), invalidEmails
+
+
+def iterRosterRows(file, fileName: str):
+    """
+    Streams the rows of a student roster as (row number, dict) pairs. JSONL
+    files have an object per line, other files are read as CSV with a header
+    line. Rows that can't be read are yielded as None.
+    """
+    if fileName.endswith((".jsonl", ".ndjson")):
+        for rowNumber, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield rowNumber, row if isinstance(row, dict) else None
+        return
+
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def importRoster(school: School, rows, chunkSize=ROSTER_CHUNK_SIZE, dryRun=False):
+    """
+    Imports the roster rows in chunks and returns the combined result of
+    importRosterChunk.
+    """
+    result = {"created": 0, "linked": 0, "errors": []}
+    seenEmails = set()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunkSize))
+        if not chunk:
+            return result
+
+        chunkResult = importRosterChunk(school, chunk, dryRun, seenEmails)
+        result["created"] += chunkResult["created"]
+        result["linked"] += chunkResult["linked"]
+        result["errors"] += chunkResult["errors"]
+
+
+def importRosterChunk(school: School, rows, dryRun=False, seenEmails=None) -> dict:
+    """
+    Creates users for the students in the rows who don't have one yet and
+    adds all of them to the school, with the same number of queries for any
+    chunk size. Created users are inactive and without a password, until the
+    student signs up with their email. Students who already belong to another
+    school are not moved, their reviews would become visible to this school.
+    Rows that can't be imported are reported in "errors" with their row
+    number, the rest of the chunk is still imported. Emails in seenEmails,
+    from the earlier chunks of the file, count as duplicates.
+    """
+    result = {"created": 0, "linked": 0, "errors": []}
+    if seenEmails is None:
+        seenEmails = set()
+
+    students = {}
+    for rowNumber, row in rows:
+        if row is None:
+            result["errors"].append({"row": rowNumber, "error": "Ugyldig række."})
+            continue
+
+        row = {str(key).strip(): value for key, value in row.items() if key}
+        email = str(row.get("email") or "").strip().lower()
+        try:
+            validate_email(email)
+        except ValidationError:
+            result["errors"].append({"row": rowNumber, "error": "Ugyldig email."})
+            continue
+
+        if email in seenEmails:
+            result["errors"].append(
+                {"row": rowNumber, "error": "Emailen findes flere gange i filen."}
+            )
+            continue
+        seenEmails.add(email)
+        students[email] = (rowNumber, row)
+
+    if not students:
+        return result
+
+    with transaction.atomic():
+        existingUsers = {
+            user.lowerEmail: user
+            for user in User.objects.annotate(lowerEmail=Lower("email"))
+            .filter(lowerEmail__in=students)
+            .only("id", "email", "role", "deletedAt")
+        }
+        SchoolStudent = School.students.through
+        otherSchoolUserIds = set(
+            SchoolStudent.objects.filter(
+                user_id__in=[user.id for user in existingUsers.values()]
+            )
+            .exclude(school_id=school.id)
+            .values_list("user_id", flat=True)
+        )
+
+        newUsers = []
+        studentEmails = []
+        for email, (rowNumber, row) in students.items():
+            user = existingUsers.get(email)
+            if user is None:
+                newUser = User(
+                    email=email,
+                    firstName=str(row.get("firstName") or "").strip()[:64],
+                    lastName=str(row.get("lastName") or "").strip()[:64],
+                    education=str(row.get("education") or "").strip()[:128] or None,
+                )
+                newUser.set_unusable_password()
+                newUsers.append(newUser)
+            elif user.deletedAt is not None:
+                result["errors"].append(
+                    {"row": rowNumber, "error": "Brugeren er slettet."}
+                )
+                continue
+            elif user.role != "student":
+                result["errors"].append(
+                    {"row": rowNumber, "error": "Brugeren er ikke elev."}
+                )
+                continue
+            elif user.id in otherSchoolUserIds:
+                result["errors"].append(
+                    {
+                        "row": rowNumber,
+                        "error": "Brugeren er allerede elev på en anden skole.",
+                    }
+                )
+                continue
+            studentEmails.append(email)
+
+        result["created"] = len(newUsers)
+        result["linked"] = len(studentEmails) - len(newUsers)
+        if dryRun:
+            return result
+
+        # Users created by a concurrent signup are linked instead
+        User.objects.bulk_create(newUsers, ignore_conflicts=True)
+        userIds = (
+            User.objects.annotate(lowerEmail=Lower("email"))
+            .filter(lowerEmail__in=studentEmails)
+            .values_list("id", flat=True)
+        )
+
+        SchoolStudent.objects.bulk_create(
+            [SchoolStudent(school_id=school.id, user_id=userId) for userId in userIds],
+            ignore_conflicts=True,
+        )
+
+    return result
+
+
+def foldSearchText(text: str, folding: dict) -> str:
+    """
+    Lowercases the text, folds the Danish letters and other diacritics and
+    separates the words with single spaces.
+    """
+    text = text.lower()
+    for letter, replacement in folding.items():
+        text = text.replace(letter, replacement)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(NON_WORD_CHARACTERS.split(text)).strip()
+
+
+def buildEducationIndex(educationTypes, folding: dict) -> list:
+    """
+    Returns (position, education type, folded text, folded text with a
+    leading space) for every education type. The leading space lets a word
+    prefix be found with a single substring check.
+    """
+    index = []
+    for position, educationType in enumerate(educationTypes):
+        folded = foldSearchText(educationType, folding)
+        index.append((position, educationType, folded, " " + folded))
+    return index
+
+
+# Built once when the module is imported, the education types are constant
+EDUCATION_INDEXES = [
+    buildEducationIndex(EDUCATION_TYPES, folding) for folding in DANISH_FOLDINGS
+]
+EDUCATION_TYPES_VERSION = hashlib.sha1(
+    json.dumps(EDUCATION_TYPES).encode("utf-8")
+).hexdigest()
+
+
+def foldEducationSearch(search: str) -> tuple:
+    """
+    Returns the search folded with every folding that applies, or an empty
+    tuple when there is nothing to search for.
+    """
+    foldings = DANISH_FOLDINGS
+    if any(letter in search.lower() for letter in DANISH_FOLDINGS[0]):
+        # The user typed the Danish letter, so the plain vowel is no match
+        foldings = DANISH_FOLDINGS[:1]
+
+    queries = tuple(foldSearchText(search, folding) for folding in foldings)
+    if not queries[0]:
+        return ()
+    return queries
+
+
+@lru_cache(maxsize=1024)
+def rankEducations(queries: tuple) -> tuple:
+    """
+    Returns the education types matching the folded queries. Ranked first
+    are the ones starting with the query, then the ones with words starting
+    with every word of it, then the ones just containing them. Matches only
+    found with the loose folding come after those, as reading a plain vowel
+    as a Danish letter is a guess. Ties keep the order of EDUCATION_TYPES.
+    """
+    ranks = {}
+    looseFoldingPenalty = 3
+    for foldingIndex, query in enumerate(queries):
+        tokens = query.split()
+        spacedTokens = [" " + token for token in tokens]
+        penalty = looseFoldingPenalty if foldingIndex else 0
+
+        for position, educationType, folded, spacedFolded in EDUCATION_INDEXES[
+            foldingIndex
+        ]:
+            if tokens[0] not in folded:
+                continue
+            if not all(token in folded for token in tokens[1:]):
+                continue
+
+            if folded.startswith(query):
+                rank = 0
+            elif all(token in spacedFolded for token in spacedTokens):
+                rank = 1
+            else:
+                rank = 2
+            rank += penalty
+
+            if position not in ranks or rank < ranks[position][0]:
+                ranks[position] = (rank, educationType)
+
+    return tuple(
+        educationType
+        for position, (rank, educationType) in sorted(
+            ranks.items(), key=lambda item: (item[1][0], item[0])
+        )
+    )
+
+
+def searchEducations(search: str, limit: int = None) -> list:
+    queries = foldEducationSearch(search)
+    if not queries:
+        return EDUCATION_TYPES[:limit]
+    return list(rankEducations(queries)[:limit])
+
+
+def educationSearchETag(search: str, limit: int = None) -> str:
+    key = f"{EDUCATION_TYPES_VERSION}:{foldEducationSearch(search)}:{limit}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
@@ -1,16 +1,30 @@
+import csv
+import io
+
+from django.db import transaction
 from django.db.models import Q
+from django.db.models.functions import Lower
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import status
 from rest_framework.response import Response
 from settings.middleware.error_handling import CustomAPIView
 from users.models import User
 from users.serializers import LightUserSerializer
-from users.utils import sendSchoolInviteEmail
+from users.utils import sendSchoolInviteEmail, sendSchoolInviteEmails
 from users.views import BasicPageination
 
-from .constants import EDUCATION_TYPES
 from .models import School, TeacherInvite
 from .serializers import SchoolSerializer
+from .utils import (
+    educationSearchETag,
+    importRoster,
+    iterRosterRows,
+    parseEmailList,
+    searchEducations,
+)
+
+MAX_BULK_INVITES = 500
 
 
 class GetTeachersFromSchoolView(CustomAPIView, BasicPageination):
@@ -143,6 +157,141 @@ class AddTeacherToSchool(CustomAPIView):
         )
 
 
+class AddTeachersToSchool(CustomAPIView):
+    """
+    <POST> Invites a list of users as teachers on the school from where the user is teacher.
+    Data: {
+        "emails": [<str>] or <str> separated by commas or new lines,
+    }
+    or a CSV file as "file".
+    """
+
+    roleNeeded = ["teacher", "teacher-admin"]
+    serializer_class = None
+
+    def post(self, request, *args, **kwargs):
+        user: User = request.user
+        school = user.teachingSchools.first()
+
+        if not school:
+            return Response(
+                {"detail": "Du er ikke en lærer på denne skole."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        try:
+            emails, invalidEmails = parseEmailList(
+                request.data.get("emails"), request.FILES.get("file")
+            )
+        except (UnicodeDecodeError, ValueError):
+            return Response(
+                {"detail": "Filen kunne ikke læses."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if not emails:
+            return Response(
+                {"detail": "Ingen gyldige emails.", "invalid": invalidEmails},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if len(emails) > MAX_BULK_INVITES:
+            return Response(
+                {
+                    "detail": f"Du kan højst invitere {MAX_BULK_INVITES} lærere ad gangen."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        currentTeachers = set(
+            school.teachers.annotate(lowerEmail=Lower("email"))
+            .filter(lowerEmail__in=emails, deletedAt__isnull=True)
+            .values_list("lowerEmail", flat=True)
+        )
+        pendingInvites = set(
+            TeacherInvite.objects.annotate(lowerEmail=Lower("email"))
+            .filter(
+                school=school,
+                lowerEmail__in=emails,
+                accepted=False,
+                deletedAt__isnull=True,
+            )
+            .values_list("lowerEmail", flat=True)
+        )
+
+        newEmails = [
+            email
+            for email in emails
+            if email not in currentTeachers and email not in pendingInvites
+        ]
+        with transaction.atomic():
+            teacherInvites = TeacherInvite.objects.bulk_create(
+                [
+                    TeacherInvite(email=email, school=school, invitedBy=user)
+                    for email in newEmails
+                ]
+            )
+            # The emails are sent from the outbox, not in this request
+            sendSchoolInviteEmails(teacherInvites)
+
+        return Response(
+            {
+                "detail": f"{len(teacherInvites)} brugere er nu inviteret som lærere på skolen.",
+                "invited": newEmails,
+                "alreadyTeachers": [
+                    email for email in emails if email in currentTeachers
+                ],
+                "alreadyInvited": [
+                    email
+                    for email in emails
+                    if email in pendingInvites and email not in currentTeachers
+                ],
+                "invalid": invalidEmails,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ImportStudentsView(CustomAPIView):
+    """
+    <POST> Imports a roster of students to the school from where the user is teacher.
+    Data: a CSV file with an "email" column and optionally "firstName", "lastName"
+    and "education", or a JSONL file with the same keys, as "file".
+    Students without a user get one, which they take over by signing up.
+    """
+
+    roleNeeded = "teacher-admin"
+    serializer_class = None
+
+    def post(self, request, *args, **kwargs):
+        user: User = request.user
+        school = user.teachingSchools.first()
+
+        if not school:
+            return Response(
+                {"detail": "Du er ikke en lærer på denne skole."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        rosterFile = request.FILES.get("file")
+        if not rosterFile:
+            return Response(
+                {"detail": "Der mangler en fil."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            content = io.TextIOWrapper(rosterFile, encoding="utf-8-sig")
+            result = importRoster(school, iterRosterRows(content, rosterFile.name))
+        except (UnicodeDecodeError, csv.Error):
+            return Response(
+                {"detail": "Filen kunne ikke læses."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
 class SearchSchoolsView(CustomAPIView, BasicPageination):
     """
     <GET> returns paginatied list of workplaces
@@ -166,8 +315,10 @@ class SearchSchoolsView(CustomAPIView, BasicPageination):
 
 class SearchEducationView(CustomAPIView):
     """
-    <GET> returns paginatied list of workplaces
+    <GET> returns a list of education types, the ones starting with the search first
     ?search=<str>
+    ?limit=<int>
+    Responses have an ETag, send it as If-None-Match to get a 304 when unchanged.
     """
 
     serializer_class = SchoolSerializer
@@ -175,13 +326,28 @@ class SearchEducationView(CustomAPIView):
     permission_classes = []
 
     def get(self, request, *args, **kwargs):
-        search = request.GET.get("search", "").lower()
+        search = request.GET.get("search", "")
 
-        results = [
-            edu_type for edu_type in EDUCATION_TYPES if search in edu_type.lower()
-        ]
+        limit = request.GET.get("limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+
+            if limit < 1:
+                return Response(
+                    data={"detail": "Ugyldigt antal resultater."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        etag = quote_etag(educationSearchETag(search, limit))
+        ifNoneMatch = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in ifNoneMatch or "*" in ifNoneMatch:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
 
-        return Response(data=results, status=status.HTTP_200_OK)
+        results = searchEducations(search, limit)
+        return Response(data=results, status=status.HTTP_200_OK, headers={"ETag": etag})
 
 
 class CheckIfTeacherAtSchoolView(CustomAPIView):
@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from djangoql.admin import DjangoQLSearchMixin
 
-from .models import User
+from .models import OutgoingEmail, User
 
 
 class UserAdmin(DjangoQLSearchMixin, BaseUserAdmin):
@@ -110,3 +111,28 @@ class UserAdmin(DjangoQLSearchMixin, BaseUserAdmin):
 
 
 admin.site.register(User, UserAdmin)
+
+
+class OutgoingEmailAdmin(DjangoQLSearchMixin, admin.ModelAdmin):
+    list_display = ("__str__", "status", "attempts", "nextAttemptAt", "sentAt")
+    list_filter = ("status",)
+    search_fields = ["recipient", "subject"]
+    ordering = ("-createdAt",)
+    actions = ["retry"]
+
+    readonly_fields = [
+        "attempts",
+        "sentAt",
+        "lastError",
+        "createdAt",
+        "updatedAt",
+    ]
+
+    @admin.action(description="Send again")
+    def retry(self, request, queryset):
+        queryset.exclude(status="sent").update(
+            status="pending", attempts=0, nextAttemptAt=timezone.now()
+        )
+
+
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
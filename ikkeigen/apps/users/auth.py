@@ -1,12 +1,13 @@
 import jwt
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from rest_framework import authentication, exceptions
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import BasePermission
 
-from .models import User
+from .models import User, authCacheKey
 
 
 class CustomTokenAuthentication(authentication.BaseAuthentication):
@@ -43,33 +44,28 @@ class CustomTokenAuthentication(authentication.BaseAuthentication):
             else:
                 return (None, None)
 
+        # Stateless mode checks the token version instead of the token key
+        credentialField = "tokenVersion" if settings.JWT_STATELESS else "token"
         if (
             not userDetails
             or not userDetails.get("user_id")
-            or not userDetails.get("token")
+            or userDetails.get(credentialField) is None
         ):
             msg = _("Invalid Login Credentials")
             raise exceptions.AuthenticationFailed(msg)
 
-        user: User = User.objects.filter(id=userDetails.get("user_id")).first()
-        if not user:
-            msg = _("Invalid Login Credentials")
-            raise exceptions.AuthenticationFailed(msg)
+        token = userDetails.get("token")
+        if settings.JWT_STATELESS:
+            user = getStatelessUser(
+                userDetails.get("user_id"), userDetails.get("tokenVersion")
+            )
+        else:
+            user = getAuthenticatedUser(userDetails.get("user_id"), token)
 
         if not user.isActive:
             msg = _("User is not verified")
             raise exceptions.AuthenticationFailed(msg)
 
-        userToken = Token.objects.filter(user=user).first()
-        if not userToken:
-            msg = _("Invalid Token")
-            raise exceptions.AuthenticationFailed(msg)
-
-        token = userDetails.get("token")
-        if token != userToken.key:
-            msg = _("Invalid Token")
-            raise exceptions.AuthenticationFailed(msg)
-
         if user.deletedAt is not None:
             msg = _(
                 "This user has been deleted. Please contact support for more information"
@@ -77,3 +73,59 @@ class CustomTokenAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed(msg)
 
         return (user, token)
+
+
+def getAuthenticatedUser(userId, tokenKey) -> User:
+    """
+    Returns the user the token key belongs to. Validated pairs are cached, so
+    most requests don't touch the database, and the cache is cleared when the
+    user or their token changes.
+    """
+    cacheKey = authCacheKey(userId)
+    cachedUser = cache.get(cacheKey)
+    if cachedUser is not None:
+        cachedTokenKey, user = cachedUser
+        if cachedTokenKey == tokenKey:
+            return user
+
+    userToken = (
+        Token.objects.select_related("user")
+        .filter(user_id=userId, key=tokenKey)
+        .first()
+    )
+    if not userToken:
+        msg = _("Invalid Token")
+        raise exceptions.AuthenticationFailed(msg)
+
+    user: User = userToken.user
+    if user.isActive and user.deletedAt is None:
+        cache.set(
+            cacheKey, (tokenKey, user), timeout=settings.AUTHENTICATION_CACHE_TIMEOUT
+        )
+    return user
+
+
+def getStatelessUser(userId, tokenVersion) -> User:
+    """
+    Returns the user if the token version of the jwt is still current. The
+    user is cached, so revocation doesn't cost a Token lookup per request.
+    """
+    cacheKey = authCacheKey(userId)
+    cachedUser = cache.get(cacheKey)
+    if cachedUser is not None:
+        _tokenKey, user = cachedUser
+    else:
+        user: User = User.objects.filter(id=userId).first()
+        if not user:
+            msg = _("Invalid Login Credentials")
+            raise exceptions.AuthenticationFailed(msg)
+
+        if user.isActive and user.deletedAt is None:
+            cache.set(
+                cacheKey, (None, user), timeout=settings.AUTHENTICATION_CACHE_TIMEOUT
+            )
+
+    if user.tokenVersion != tokenVersion:
+        msg = _("Invalid Token")
+        raise exceptions.AuthenticationFailed(msg)
+    return user
@@ -0,0 +1,55 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.utils import sendQueuedEmails
+
+
+class Command(BaseCommand):
+    help = "Sends the emails waiting in the outbox, until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send the emails that are due and exit",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when the outbox has nothing due",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of emails sent per connection to the mail server",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = sendQueuedEmails(options["batch_size"])
+            except Exception:
+                if options["once"]:
+                    raise
+                # E.g. the outbox table missing until the first migrate is
+                # done, or the database restarting. Wait and try again.
+                self.stderr.write(f"Sending emails failed:\n{traceback.format_exc()}")
+                close_old_connections()
+                time.sleep(options["interval"])
+                continue
+
+            if sent:
+                self.stdout.write(f"Sent {sent} emails")
+
+            if options["once"]:
+                if not sent:
+                    return
+                continue
+
+            close_old_connections()
+            if not sent:
+                time.sleep(options["interval"])
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_user_profilepictureurl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="tokenVersion",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.3 on 2026-10-18 08:09
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_user_tokenversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "uuid",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                ("updatedAt", models.DateTimeField(auto_now=True, null=True)),
+                ("createdAt", models.DateTimeField(auto_now_add=True)),
+                ("deletedAt", models.DateTimeField(blank=True, null=True)),
+                ("recipient", models.EmailField(max_length=254)),
+                ("subject", models.CharField(max_length=255)),
+                ("body", models.TextField()),
+                ("htmlBody", models.TextField(blank=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "nextAttemptAt",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("sentAt", models.DateTimeField(blank=True, null=True)),
+                ("lastError", models.TextField(blank=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "nextAttemptAt"], name="outgoingemail_due_idx"
+                    )
+                ],
+            },
+        ),
+    ]
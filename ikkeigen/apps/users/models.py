@@ -4,11 +4,13 @@ from datetime import datetime
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models.signals import post_save, pre_save
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext as _
+from rest_framework.authtoken.models import Token
 
 
 class BaseModel(models.Model):
@@ -17,10 +19,46 @@ class BaseModel(models.Model):
     createdAt = models.DateTimeField(auto_now_add=True)
     deletedAt = models.DateTimeField(blank=True, null=True)
 
+    # Fields whose value is remembered when the instance is loaded, so
+    # changes can be detected without reading the row again
+    trackedFields = []
+
     class Meta:
         # This makes the model abstract, so it won’t create a database table
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.rememberTrackedFields()
+        return instance
+
+    def rememberTrackedFields(self):
+        self._loadedValues = {}
+        for field in self.trackedFields:
+            attname = self._meta.get_field(field).attname
+            # Deferred fields aren't loaded, so there is nothing to compare
+            if attname in self.__dict__:
+                self._loadedValues[field] = self.__dict__[attname]
+
+    def loadedValue(self, field):
+        return getattr(self, "_loadedValues", {}).get(field)
+
+    def changedFields(self) -> set:
+        """
+        Returns the tracked fields that changed since the instance was loaded.
+        On instances that weren't loaded from the database all of them count.
+        """
+        loadedValues = getattr(self, "_loadedValues", None)
+        if loadedValues is None:
+            return set(self.trackedFields)
+
+        return {
+            field
+            for field, value in loadedValues.items()
+            if getattr(self, self._meta.get_field(field).attname) != value
+        }
+
 
 def randomColor():
     colors = [
@@ -74,6 +112,9 @@ class User(AbstractUser, BaseModel):
         default="student",
     )
 
+    # Part of every jwt, bumping it revokes them in JWT_STATELESS mode
+    tokenVersion = models.PositiveIntegerField(default=0)
+
     EMAIL_FIELD = "email"
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -102,6 +143,16 @@ class User(AbstractUser, BaseModel):
         self.last_login = timezone.now()
         self.save(update_fields=["last_login"])
 
+    def revokeTokens(self):
+        """
+        Makes every jwt issued to the user invalid, in both the token and
+        the stateless mode.
+        """
+        with transaction.atomic():
+            Token.objects.filter(user=self).delete()
+            self.tokenVersion += 1
+            self.save(update_fields=["tokenVersion"])
+
 
 def createSuperuser(email, password):
     user = User.objects.create(
@@ -113,3 +164,63 @@ def createSuperuser(email, password):
     user.set_password(password)
     user.save()
     return user
+
+
+class OutgoingEmail(BaseModel):
+    """
+    An email waiting to be sent, or the record of one that was. The
+    sendemails worker sends them, so requests never wait on the mail server.
+    """
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    htmlBody = models.TextField(blank=True)
+
+    status = models.CharField(
+        max_length=16,
+        choices=[
+            ("pending", "Pending"),
+            ("sent", "Sent"),
+            ("failed", "Failed"),
+        ],
+        default="pending",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=timezone.now)
+    sentAt = models.DateTimeField(blank=True, null=True)
+    lastError = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves the worker looking for emails that are due
+            models.Index(
+                fields=["status", "nextAttemptAt"],
+                name="outgoingemail_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"[{self.status}] {self.subject} to {self.recipient}"
+
+
+def authCacheKey(userId):
+    return f"auth:user:{userId}"
+
+
+def deleteAuthCache(userId):
+    # Deleted after the commit, so a request can't cache the old row again
+    # before the change is visible
+    transaction.on_commit(lambda: cache.delete(authCacheKey(userId)))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def deleteAuthCacheOnUserChange(sender, instance=None, **kwargs):
+    deleteAuthCache(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def deleteAuthCacheOnTokenChange(sender, instance=None, **kwargs):
+    deleteAuthCache(instance.user_id)
@@ -5,18 +5,34 @@ from rest_framework.views import APIView
 
 class UserPermissions(APIView):
     roleNeeded = None
+    noPermissionForMethods = []
+
+    # Built from the two above when the view class is created
+    rolesNeeded = frozenset()
+    methodsWithoutPermission = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # roleNeeded is either a single role or a list of them
+        roleNeeded = cls.roleNeeded
+        if isinstance(roleNeeded, str):
+            roleNeeded = [roleNeeded]
+        cls.rolesNeeded = frozenset(roleNeeded or ())
+        cls.methodsWithoutPermission = frozenset(
+            method.lower() for method in cls.noPermissionForMethods
+        )
 
     def check_permissions(self, request):
         requestMethod = request.method
-        if requestMethod.lower() not in self.noPermissionForMethods:
-            if self.roleNeeded:
+        if requestMethod.lower() not in self.methodsWithoutPermission:
+            if self.rolesNeeded:
                 user = request.user
                 if not user or not user.is_authenticated:
                     raise PermissionDenied(
                         _("You must be logged in to perform this action.")
                     )
 
-                if user.role != self.roleNeeded and user.role not in self.roleNeeded:
+                if user.role not in self.rolesNeeded:
                     raise PermissionDenied(
                         _("You do not have permission to perform this action.")
                     )
@@ -61,7 +61,13 @@ class UserSerializer(serializers.ModelSerializer):
         return email
 
     def get_schoolName(self, obj: User) -> Union[str, None]:
-        school = obj.schools.first()
+        if "schools" in getattr(obj, "_prefetched_objects_cache", {}):
+            # Use the prefetched schools instead of querying for the first one
+            schools = obj.schools.all()
+            school = min(schools, key=lambda school: school.pk, default=None)
+        else:
+            school = obj.schools.first()
+
         if not school:
             return None
 
@@ -91,8 +97,12 @@ class UserCreatorSerializer(UserSerializer):
         fields = ("email",)
 
     def validate_email(self, value):
-        # Ensure the user doesn't already exist
         email = value.lower()
+        # A user who never verified their email being taken over
+        if self.instance and email == self.instance.email.lower():
+            return email
+
+        # Ensure the user doesn't already exist
         user: User | None = self.get_user(email)
         if user:
             raise serializers.ValidationError(
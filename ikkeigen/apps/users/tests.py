@@ -0,0 +1,73 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import User, authCacheKey
+from .utils import createJwtToken
+
+
+class AuthenticationCacheTests(TestCase):
+    """
+    Changes to a user reach the auth cache once they are committed, so the
+    on_commit callbacks are run by the tests.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="elev@skolen.dk", isActive=True)
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse("user:current_user_view")
+
+    def getCurrentUser(self, jwtToken=None):
+        jwtToken = jwtToken or createJwtToken(self.user, self.token)
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f"Token {jwtToken}")
+
+    def assertCached(self):
+        self.assertEqual(self.getCurrentUser().status_code, 200)
+        self.assertIsNotNone(cache.get(authCacheKey(self.user.id)))
+
+    def test_logout_rejects_the_same_jwt(self):
+        jwtToken = createJwtToken(self.user, self.token)
+        self.assertCached()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("user:logout_view"), HTTP_AUTHORIZATION=f"Token {jwtToken}"
+            )
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.getCurrentUser(jwtToken).status_code, 403)
+
+    def test_deactivated_user_is_rejected_when_cached(self):
+        self.assertCached()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.isActive = False
+            self.user.save()
+
+        self.assertEqual(self.getCurrentUser().status_code, 403)
+
+    def test_deleted_user_is_rejected_when_cached(self):
+        self.assertCached()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.deletedAt = timezone.now()
+            self.user.save()
+
+        self.assertEqual(self.getCurrentUser().status_code, 403)
+
+
+@override_settings(JWT_STATELESS=True)
+class StatelessAuthenticationTests(AuthenticationCacheTests):
+    def test_bumped_token_version_is_rejected(self):
+        jwtToken = createJwtToken(self.user, self.token)
+        self.assertCached()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.tokenVersion += 1
+            self.user.save()
+
+        self.assertEqual(self.getCurrentUser(jwtToken).status_code, 403)
+        self.assertEqual(self.getCurrentUser().status_code, 200)
@@ -26,6 +26,14 @@ def get_urls():
         )
     )
 
+    urls.append(
+        re_path(
+            r"^logout/$",
+            views.LogoutView.as_view(),
+            name="logout_view",
+        )
+    )
+
     urls.append(
         re_path(
             r"^verify-user/(?P<userUuid>\w+)/$",
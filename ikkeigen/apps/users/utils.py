@@ -1,11 +1,20 @@
+import html
 import random
+import re
+from datetime import datetime, timedelta
 
+import jwt
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import engines
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.authtoken.models import Token
 from schools.models import TeacherInvite
 
-from users.models import User
+from users.models import OutgoingEmail, User
 
 
 def generateVerificationId(length=6):
@@ -21,47 +30,234 @@ def generateVerificationId(length=6):
     return verificationCode
 
 
-def sendVerificationEmail(user: User):
-    try:
-        verificationCode = user.verificationCode
-        subject = "Verificer din e-mailadresse"
-        body = render_to_string(
-            "email/email-verification-da.html",
-            {
-                "user": user,
-                "verifyCode": verificationCode,
-            },
+def createJwtToken(user: User, token: Token) -> str:
+    """
+    Returns the jwt for the user. It carries both the token key and the token
+    version, so it works with and without JWT_STATELESS.
+    """
+    payload = {
+        "user_id": user.id,
+        "exp": datetime.now() + timedelta(days=1),
+        "iat": datetime.now(),
+        "token": token.key,
+        "tokenVersion": user.tokenVersion,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
+
+
+def queueEmail(recipient, subject, body, htmlBody="") -> OutgoingEmail:
+    """
+    Adds the email to the outbox, the sendemails worker sends it.
+    """
+    return queueEmails([(recipient, subject, body, htmlBody)])[0]
+
+
+def queueEmails(messages) -> list:
+    """
+    Adds the (recipient, subject, body, htmlBody) messages to the outbox in a
+    single query.
+    """
+    emails = OutgoingEmail.objects.bulk_create(
+        [
+            OutgoingEmail(
+                recipient=recipient, subject=subject, body=body, htmlBody=htmlBody
+            )
+            for recipient, subject, body, htmlBody in messages
+        ]
+    )
+    if settings.EMAIL_OUTBOX_EAGER:
+        # One batch at a time until nothing is due, failed emails wait for
+        # their retry so this ends
+        while sendQueuedEmails():
+            pass
+    return emails
+
+
+def sendQueuedEmails(batchSize=None) -> int:
+    """
+    Sends a batch of the due emails in the outbox over a single connection to
+    the mail server. Failed emails are retried with a doubling delay until
+    EMAIL_OUTBOX_MAX_ATTEMPTS, after that they are marked as failed.
+    Returns the number of emails that were sent.
+    """
+    batchSize = batchSize or settings.EMAIL_OUTBOX_BATCH_SIZE
+    sentCount = 0
+
+    with transaction.atomic():
+        # Locked rows are skipped, so more than one worker can send at a time
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", nextAttemptAt__lte=timezone.now())
+            .order_by("nextAttemptAt")[:batchSize]
+        )
+        if not emails:
+            return 0
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            connectionError = e
+        else:
+            connectionError = None
+
+        for email in emails:
+            email.attempts += 1
+            email.updatedAt = timezone.now()
+            if connectionError is not None:
+                recordEmailFailure(email, connectionError)
+                continue
+
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[email.recipient],
+                connection=connection,
+            )
+            if email.htmlBody:
+                message.attach_alternative(email.htmlBody, "text/html")
+
+            try:
+                message.send()
+            except Exception as e:
+                recordEmailFailure(email, e)
+            else:
+                email.status = "sent"
+                email.sentAt = timezone.now()
+                email.lastError = ""
+                sentCount += 1
+
+        if connectionError is None:
+            connection.close()
+
+        OutgoingEmail.objects.bulk_update(
+            emails,
+            ["status", "attempts", "nextAttemptAt", "sentAt", "lastError", "updatedAt"],
         )
 
-        send_mail(
-            subject=subject,
-            message=body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=body,
+    failedEmails = [email for email in emails if email.status == "failed"]
+    if failedEmails:
+        from settings.middleware.error_handling import sendDiscordMessage
+
+        sendDiscordMessage(
+            "**Emails could not be sent:**\n"
+            + "\n".join(f"{email}: {email.lastError}" for email in failedEmails)
         )
-    except Exception as e:
-        print(f"Error sending verification email to {user.email}: {e}")
 
+    return sentCount
 
-def sendSchoolInviteEmail(schoolInvite: TeacherInvite):
-    try:
-        subject = f"Du er blevet inviteret til at deltage i {schoolInvite.school.name} på IkkeIgen"
-        body = render_to_string(
-            "email/school-invite-da.html",
-            {
-                "invitationLink": f"https://ikkeigen.dk/api/accept-invite/{schoolInvite.uuid.hex}",
-                "schoolName": schoolInvite.school.name,
-                "inviteeName": schoolInvite.invitedBy.getFullName(),
-            },
+
+def recordEmailFailure(email: OutgoingEmail, error: Exception):
+    email.lastError = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = "failed"
+    else:
+        retryDelay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+        email.nextAttemptAt = timezone.now() + timedelta(seconds=retryDelay)
+
+
+def htmlToTextTemplate(source: str) -> str:
+    """
+    Turns the source of an html email template into the source of a plain
+    text template, keeping the template tags and variables.
+    """
+    text = re.sub(r"(?is)<(head|style|script)\b.*?</\1>|<!DOCTYPE[^>]*>", "", source)
+    text = re.sub(r'(?is)<a\b[^>]*href="([^"]*)"[^>]*>(.*?)</a>', r"\2: \1", text)
+    text = re.sub(r"(?i)<br\s*/?>|</(p|div|h\d|li|tr)>", "\n", text)
+    text = html.unescape(re.sub(r"<[^>]+>", "", text))
+
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return "{% autoescape off %}" + text + "\n{% endautoescape %}"
+
+
+class EmailTemplate:
+    """
+    An html email template with its subject. They are compiled once per
+    process, together with a plain text version generated from the html.
+    """
+
+    def __init__(self, templateName, subject):
+        self.templateName = templateName
+        self.subject = subject
+
+    @cached_property
+    def htmlTemplate(self):
+        return get_template(self.templateName)
+
+    @cached_property
+    def textTemplate(self):
+        source = self.htmlTemplate.template.source
+        return engines["django"].from_string(htmlToTextTemplate(source))
+
+    @cached_property
+    def subjectTemplate(self):
+        return engines["django"].from_string(
+            "{% autoescape off %}" + self.subject + "{% endautoescape %}"
+        )
+
+    def render(self, context) -> tuple:
+        """
+        Returns the subject, the plain text body and the html body.
+        """
+        return (
+            self.subjectTemplate.render(context).strip(),
+            self.textTemplate.render(context),
+            self.htmlTemplate.render(context),
         )
 
-        send_mail(
-            subject=subject,
-            message=body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[schoolInvite.email],
-            html_message=body,
+    def queue(self, recipientsAndContexts) -> list:
+        """
+        Renders the email for every (recipient, context) pair and adds them
+        to the outbox together.
+        """
+        return queueEmails(
+            [
+                (recipient, *self.render(context))
+                for recipient, context in recipientsAndContexts
+            ]
         )
-    except Exception as e:
-        print(f"Error sending school invite email to {schoolInvite.email}: {e}")
+
+
+VERIFICATION_EMAIL = EmailTemplate(
+    "email/email-verification-da.html", "Verificer din e-mailadresse"
+)
+SCHOOL_INVITE_EMAIL = EmailTemplate(
+    "email/school-invite-da.html",
+    "Du er blevet inviteret til at deltage i {{ schoolName }} på IkkeIgen",
+)
+
+
+def sendVerificationEmail(user: User):
+    VERIFICATION_EMAIL.queue(
+        [
+            (
+                user.email,
+                {
+                    "user": user,
+                    "verifyCode": user.verificationCode,
+                },
+            )
+        ]
+    )
+
+
+def sendSchoolInviteEmail(schoolInvite: TeacherInvite):
+    sendSchoolInviteEmails([schoolInvite])
+
+
+def sendSchoolInviteEmails(schoolInvites):
+    SCHOOL_INVITE_EMAIL.queue(
+        [
+            (
+                schoolInvite.email,
+                {
+                    "invitationLink": f"https://ikkeigen.dk/api/accept-invite/{schoolInvite.uuid.hex}",
+                    "schoolName": schoolInvite.school.name,
+                    "inviteeName": schoolInvite.invitedBy.getFullName(),
+                },
+            )
+            for schoolInvite in schoolInvites
+        ]
+    )
@@ -1,13 +1,21 @@
+import base64
+import hashlib
+import json
 from collections import OrderedDict
-from datetime import datetime, timedelta
 
-import jwt
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -16,7 +24,70 @@ from settings.middleware.error_handling import CustomAPIView
 
 from .models import User
 from .serializers import UserCreatorSerializer, UserSerializer
-from .utils import generateVerificationId, sendVerificationEmail
+from .utils import createJwtToken, generateVerificationId, sendVerificationEmail
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator for large lists, where an exact count on every request is too
+    expensive. Counts are cached per query for a short while, and on Postgres
+    the planner estimate is used instead when it is above the threshold.
+    """
+
+    countIsExact = True
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is None:
+            return len(self.object_list)
+
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        cacheKey = (
+            "pagination:count:"
+            + hashlib.sha1(f"{sql}:{params}".encode("utf-8")).hexdigest()
+        )
+        cachedCount = cache.get(cacheKey)
+        if cachedCount is not None:
+            count, self.countIsExact = cachedCount
+            return count
+
+        count = self.estimateCount(sql, params)
+        if count is not None:
+            self.countIsExact = False
+        else:
+            count = self.object_list.count()
+            # Small results are cheap to count, and should show new rows
+            # (like imported workplaces) right away
+            if count <= self.per_page:
+                return count
+
+        cache.set(
+            cacheKey,
+            (count, self.countIsExact),
+            timeout=settings.PAGINATION_COUNT_CACHE_TIMEOUT,
+        )
+        return count
+
+    def estimateCount(self, sql, params):
+        connection = connections[self.object_list.db]
+        if connection.vendor != "postgresql":
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+        if estimate < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            return None
+        return estimate
 
 
 class BasicPageination(PageNumberPagination):
@@ -24,6 +95,13 @@ class BasicPageination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 500
 
+    cursor_query_param = "cursor"
+    # Views that support keyset pagination set the ordering of the pages,
+    # e.g. ("-createdAt", "-id"), where the last field must be unique.
+    # Clients opt in by sending ?cursor= and then follow the next cursor.
+    # It skips the count, which is returned as None.
+    cursorOrdering = None
+
     def get_paginated_response(self, data):
         current_page = self.page.number
 
@@ -31,6 +109,10 @@ class BasicPageination(PageNumberPagination):
             OrderedDict(
                 [
                     ("count", self.page.paginator.count),
+                    (
+                        "countIsExact",
+                        getattr(self.page.paginator, "countIsExact", True),
+                    ),
                     ("next", current_page + 1 if self.page.has_next() else None),
                     (
                         "previous",
@@ -51,8 +133,106 @@ class BasicPageination(PageNumberPagination):
             page_number = 1
         return page_number
 
-    def paginate(self, queryset, request, context=None, **args):
-        page = self.paginate_queryset(queryset.distinct(), request)
+    def usesCursor(self, request):
+        return (
+            self.cursorOrdering is not None
+            and self.cursor_query_param in request.query_params
+        )
+
+    def encodeCursor(self, instance):
+        values = [getattr(instance, field.lstrip("-")) for field in self.cursorOrdering]
+        # str() keeps the microseconds of datetimes, which the JSON encoder drops
+        cursor = json.dumps(values, default=str)
+        return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("utf-8")
+
+    def decodeCursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        except (TypeError, ValueError):
+            values = None
+
+        if not isinstance(values, list) or len(values) != len(self.cursorOrdering):
+            raise NotFound("Ugyldig cursor.")
+
+        # Parse every value as its field, so a tampered cursor is a 404 and
+        # never reaches the database
+        try:
+            values = [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.cursorOrdering, values)
+            ]
+        except (ValidationError, TypeError):
+            raise NotFound("Ugyldig cursor.")
+        if None in values:
+            raise NotFound("Ugyldig cursor.")
+        return values
+
+    def getCursorFilter(self, values):
+        """
+        Returns the filter for the rows after the cursor. The first field is
+        also bounded on its own, so the database can seek the index to it.
+        """
+        firstField = self.cursorOrdering[0]
+        firstLookup = "lte" if firstField.startswith("-") else "gte"
+        bound = Q(**{f"{firstField.lstrip('-')}__{firstLookup}": values[0]})
+
+        filter = Q()
+        previousEqual = Q()
+        for field, value in zip(self.cursorOrdering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            filter |= previousEqual & Q(**{f"{name}__{lookup}": value})
+            previousEqual &= Q(**{name: value})
+        return bound & filter
+
+    def paginateCursor(self, queryset, request, serializerClass, context):
+        pageSize = self.get_page_size(request)
+        queryset = queryset.order_by(*self.cursorOrdering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.getCursorFilter(self.decodeCursor(cursor, queryset.model))
+            )
+
+        # One extra row tells if there is a next page
+        page = list(queryset[: pageSize + 1])
+        nextCursor = None
+        if len(page) > pageSize:
+            page = page[:pageSize]
+            nextCursor = self.encodeCursor(page[-1])
+
+        serializer = serializerClass(page, many=True, context=context)
+        return Response(
+            OrderedDict(
+                [
+                    ("count", None),
+                    ("countIsExact", False),
+                    ("next", nextCursor),
+                    ("previous", None),
+                    ("results", serializer.data),
+                ]
+            )
+        )
+
+    def paginate(self, queryset, request, context=None, distinct=False, **args):
+        # Only querysets that join a to-many relation need distinct, it makes
+        # the database sort or hash the whole result set
+        if distinct:
+            queryset = queryset.distinct()
+
+        if self.usesCursor(request):
+            context = context or {}
+            context["request"] = request
+            if not context.get("userUuid"):
+                if request.user.is_authenticated:
+                    context["userUuid"] = request.user.uuid
+
+            return self.paginateCursor(
+                queryset, request, self.serializer_class, context
+            )
+
+        page = self.paginate_queryset(queryset, request)
         if page is not None:
             context = context or {}
             context["request"] = request
@@ -66,9 +246,20 @@ class BasicPageination(PageNumberPagination):
         return self.get_paginated_response([])
 
     def paginateSpecificSerializer(
-        self, queryset, request, serializerClass, context=None, **args
+        self, queryset, request, serializerClass, context=None, distinct=False, **args
     ):
-        page = self.paginate_queryset(queryset.distinct(), request)
+        if distinct:
+            queryset = queryset.distinct()
+
+        if self.usesCursor(request):
+            context = context or {}
+            if not context.get("userUuid"):
+                if request.user.is_authenticated:
+                    context["userUuid"] = request.user.uuid
+
+            return self.paginateCursor(queryset, request, serializerClass, context)
+
+        page = self.paginate_queryset(queryset, request)
         if page is not None:
             context = context or {}
             if not context.get("userUuid"):
@@ -111,7 +302,24 @@ class SignUpView(CustomAPIView):
             data = {"error": "Adgangskoderne stemmer ikke overens"}
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = UserCreatorSerializer(data=inputData)
+        # Users who never verified their email, like students imported from a
+        # school roster, are taken over by signing up. A later signup replaces
+        # the password again until the email is verified, so whoever signs up
+        # first can't lock the owner of the email out.
+        pendingUser = User.objects.filter(
+            email__iexact=str(inputData.get("email") or ""),
+            isActive=False,
+            deletedAt__isnull=True,
+        ).first()
+        if (
+            pendingUser
+            and pendingUser.has_usable_password()
+            and not pendingUser.verificationCode
+        ):
+            # Verified before and deactivated since
+            pendingUser = None
+
+        serializer = UserCreatorSerializer(pendingUser, data=inputData)
         if serializer.is_valid(raise_exception=True):
             serializer.save()
             user: User = serializer.instance
@@ -122,6 +330,11 @@ class SignUpView(CustomAPIView):
 
             user.save()
             responseData = self.serializer_class(user).data
+            if pendingUser:
+                # The details from the roster are shown once the email is verified
+                responseData.update(
+                    firstName="", lastName="", education=None, schoolName=None
+                )
             return Response(responseData, status=status.HTTP_201_CREATED)
         return Response(
             {"error": "Noget gik galt. Prøv igen senere", "extra": serializer.errors},
@@ -162,13 +375,7 @@ class LoginView(CustomAPIView):
         token = Token.objects.filter(user=user).first()
         if not token:
             token = Token.objects.create(user=user)
-        payload = {
-            "user_id": user.id,
-            "exp": datetime.now() + timedelta(days=1),
-            "iat": datetime.now(),
-            "token": token.key,
-        }
-        jwtToken = jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
+        jwtToken = createJwtToken(user, token)
 
         responseData = self.serializer_class(user).data
         responseData["jwtToken"] = jwtToken
@@ -202,7 +409,8 @@ class VerifyUserView(CustomAPIView):
             )
 
         userVerifyId = user.verificationCode
-        if not userVerifyId.lower() == verifyCode:
+        # Imported students have no code until they sign up themselves
+        if not userVerifyId or userVerifyId.lower() != verifyCode:
             return Response(
                 data={"error": "Den bekræftelseskode er forkert. Prøv venligst igen"},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -213,13 +421,7 @@ class VerifyUserView(CustomAPIView):
         user.save()
 
         token = Token.objects.create(user=user)
-        payload = {
-            "user_id": user.id,
-            "exp": datetime.now() + timedelta(days=1),
-            "iat": datetime.now(),
-            "token": token.key,
-        }
-        jwtToken = jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
+        jwtToken = createJwtToken(user, token)
 
         responseData = self.serializer_class(user).data
         responseData["jwtToken"] = jwtToken
@@ -282,3 +484,16 @@ class GetCurrentUserView(CustomAPIView):
         user = request.user
         responseData = self.serializer_class(user).data
         return Response(data=responseData, status=status.HTTP_200_OK)
+
+
+class LogoutView(CustomAPIView):
+    """
+    <POST> Logs the current user out, every jwt issued to them stops working
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        user: User = request.user
+        user.revokeTokens()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = "/api/soeg-opslag-kort/-1/-1"
+# The map area covering all of Denmark
+SEARCH_AREA = {
+    "zoom": 1,
+    "north": 56.43007523471859,
+    "south": 55.215764803933716,
+    "east": 15.529157706956447,
+    "west": 6.954356941849672,
+}
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of calling laerepladsen while it is considered down.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to the upstream for a cooldown after too many failures in a
+    row. After the cooldown a single call is let through to probe it again.
+    """
+
+    def __init__(self, failureThreshold: int, cooldown: float):
+        self.failureThreshold = failureThreshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.openedAt = None
+        self.lock = threading.Lock()
+
+    def allowRequest(self) -> bool:
+        with self.lock:
+            if self.openedAt is None:
+                return True
+            if time.monotonic() - self.openedAt < self.cooldown:
+                return False
+            # Let the next call probe the upstream, and keep the circuit open
+            # for everybody else until it reports back
+            self.openedAt = time.monotonic()
+            return True
+
+    def recordSuccess(self):
+        with self.lock:
+            self.failures = 0
+            self.openedAt = None
+
+    def recordFailure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failureThreshold:
+                self.openedAt = time.monotonic()
+
+
+class UpstreamMetrics:
+    """
+    Latency and failure counters for the calls to the upstream.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+
+    def recordCall(self, seconds: float, failed: bool):
+        with self.lock:
+            self.calls += 1
+            self.totalSeconds += seconds
+            self.maxSeconds = max(self.maxSeconds, seconds)
+            if failed:
+                self.failures += 1
+
+    def recordRejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "averageSeconds": self.totalSeconds / self.calls if self.calls else 0,
+                "maxSeconds": self.maxSeconds,
+            }
+
+
+class LaerepladsenClient:
+    """
+    Talks to the laerepladsen API over a shared keep-alive connection pool.
+    Connection errors and 5xx responses are retried with backoff, and a
+    circuit breaker stops calling the API for a while when it keeps failing.
+    """
+
+    def __init__(
+        self,
+        baseUrl: str,
+        timeout: float = 5,
+        poolSize: int = 10,
+        retries: int = 2,
+        backoffFactor: float = 0.3,
+        failureThreshold: int = 5,
+        cooldown: float = 60,
+    ):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.timeout = timeout
+        self.circuitBreaker = CircuitBreaker(failureThreshold, cooldown)
+        self.metrics = UpstreamMetrics()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoffFactor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=poolSize,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path: str, params: dict = None) -> requests.Response:
+        if not self.circuitBreaker.allowRequest():
+            self.metrics.recordRejected()
+            raise CircuitOpenError("Laerepladsen is unavailable, try again later")
+
+        startedAt = time.monotonic()
+        failed = True
+        try:
+            response = self.session.get(
+                self.baseUrl + path, params=params, timeout=self.timeout
+            )
+            # Client errors are our fault, they say nothing about the upstream
+            failed = response.status_code >= 500
+            response.raise_for_status()
+            return response
+        finally:
+            seconds = time.monotonic() - startedAt
+            self.metrics.recordCall(seconds, failed)
+            if failed:
+                self.circuitBreaker.recordFailure()
+            else:
+                self.circuitBreaker.recordSuccess()
+            logger.info(
+                "GET %s took %.3fs%s", path, seconds, " (failed)" if failed else ""
+            )
+
+    def search(self, search: str) -> list[dict]:
+        """
+        Returns the laeresteder matching the free text search.
+        """
+        params = {
+            "fritekst": search,
+            "aftaleFilter": "alle",
+            "medarbejdereFilter": "alle",
+            **SEARCH_AREA,
+        }
+        data = self.get(SEARCH_PATH, params=params).json()
+        return data.get("laeresteder") or []
+
+
+@lru_cache(maxsize=None)
+def getLaerepladsenClient() -> LaerepladsenClient:
+    """
+    Returns the client shared by the whole process, so the connections to
+    laerepladsen are reused between lookups.
+    """
+    return LaerepladsenClient(
+        settings.LAEREPLADSEN_BASE_URL,
+        timeout=settings.LAEREPLADSEN_TIMEOUT,
+        poolSize=settings.LAEREPLADSEN_POOL_SIZE,
+        retries=settings.LAEREPLADSEN_RETRIES,
+        failureThreshold=settings.LAEREPLADSEN_CIRCUIT_FAILURES,
+        cooldown=settings.LAEREPLADSEN_CIRCUIT_COOLDOWN,
+    )
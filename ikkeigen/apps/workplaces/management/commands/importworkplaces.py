@@ -0,0 +1,174 @@
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workplaces.utils import importWorkplaces, parseLaerested
+
+READ_SIZE = 64 * 1024
+
+
+def iterJsonLines(file):
+    for lineNumber, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise CommandError(f"Invalid JSON on line {lineNumber}: {e}")
+
+
+def iterJsonArray(file):
+    """
+    Yields the items of the laeresteder array one at a time, without loading
+    the whole document. The document is either the array itself or an object
+    with the array under "laeresteder", like the API responses.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    endOfFile = False
+
+    def readMore():
+        nonlocal buffer, endOfFile
+        chunk = file.read(READ_SIZE)
+        if not chunk:
+            endOfFile = True
+        buffer += chunk
+
+    # Find the start of the array
+    while True:
+        stripped = buffer.lstrip()
+        if stripped.startswith("{"):
+            keyIndex = buffer.find('"laeresteder"')
+            arrayIndex = buffer.find("[", keyIndex) if keyIndex != -1 else -1
+        else:
+            arrayIndex = buffer.find("[") if stripped else -1
+
+        if arrayIndex != -1:
+            buffer = buffer[arrayIndex + 1 :]
+            break
+        if endOfFile:
+            raise CommandError("Could not find a list of laeresteder in the file")
+        readMore()
+
+    while True:
+        buffer = buffer.lstrip().removeprefix(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        if not buffer:
+            if endOfFile:
+                raise CommandError("The list of laeresteder is not closed")
+            readMore()
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError as e:
+            if endOfFile:
+                raise CommandError(f"Invalid JSON in the list of laeresteder: {e}")
+            readMore()
+            continue
+
+        buffer = buffer[end:]
+        yield item
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports workplaces and categories from a laerepladsen export. "
+        "The file is either JSON (a list, or an object with a laeresteder list) "
+        "or JSON lines with one laerested per line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to the .json or .jsonl export")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of laeresteder written per transaction",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the laeresteder a previous run already imported",
+        )
+        parser.add_argument(
+            "--state-file",
+            help="Where the progress is stored (defaults to <path>.progress)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Read and validate the file without writing anything",
+        )
+
+    def readLaeresteder(self, file, path):
+        if path.endswith((".jsonl", ".ndjson")):
+            return iterJsonLines(file)
+        return iterJsonArray(file)
+
+    def readState(self, stateFile):
+        if not os.path.exists(stateFile):
+            return 0
+        with open(stateFile) as file:
+            return json.load(file).get("imported", 0)
+
+    def writeState(self, stateFile, imported):
+        with open(stateFile, "w") as file:
+            json.dump({"imported": imported}, file)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        chunkSize = options["chunk_size"]
+        dryRun = options["dry_run"]
+        stateFile = options["state_file"] or f"{path}.progress"
+
+        if chunkSize < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+
+        skip = self.readState(stateFile) if options["resume"] else 0
+        if skip:
+            self.stdout.write(f"Resuming after {skip} already imported laeresteder")
+
+        processed = skip
+        created = 0
+        with open(path, encoding="utf-8") as file:
+            laeresteder = islice(self.readLaeresteder(file, path), skip, None)
+            while True:
+                chunk = list(islice(laeresteder, chunkSize))
+                if not chunk:
+                    break
+
+                if dryRun:
+                    for laerested in chunk:
+                        parseLaerested(laerested)
+                else:
+                    created += importWorkplaces(chunk)
+                    self.writeState(stateFile, processed + len(chunk))
+
+                processed += len(chunk)
+                if dryRun:
+                    self.stdout.write(f"Read {processed} laeresteder")
+                else:
+                    self.stdout.write(
+                        f"Processed {processed} laeresteder, {created} new workplaces"
+                    )
+
+        if dryRun:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Dry run: {processed} laeresteder would be imported"
+                )
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {processed} laeresteder processed, {created} new workplaces"
+            )
+        )
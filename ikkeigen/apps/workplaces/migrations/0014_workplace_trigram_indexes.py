@@ -0,0 +1,45 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# GIN trigram indexes for the workplace search. Django compiles `icontains`
+# to UPPER(column) LIKE UPPER(...), so those lookups need expression indexes,
+# while the trigram word similarity on the name uses the plain column.
+TRIGRAM_INDEXES = [
+    ("workplaces_workplace_name_trgm", '"name"'),
+    ("workplaces_workplace_name_upper_trgm", 'UPPER("name")'),
+    ("workplaces_workplace_vat_upper_trgm", 'UPPER("vat")'),
+    ("workplaces_workplace_address_upper_trgm", 'UPPER("address")'),
+]
+
+
+def createTrigramIndexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for indexName, expression in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{indexName}" '
+            f'ON "workplaces_workplace" USING gin ({expression} gin_trgm_ops)'
+        )
+
+
+def dropTrigramIndexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for indexName, expression in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{indexName}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workplaces", "0013_remove_workplace_website_workplace_address"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(createTrigramIndexes, dropTrigramIndexes),
+    ]
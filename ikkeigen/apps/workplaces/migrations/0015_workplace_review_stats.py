@@ -0,0 +1,54 @@
+# Generated by Django 4.2.3 on 2026-10-18 07:57
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calculateReviewStats(apps, schema_editor):
+    Workplace = apps.get_model("workplaces", "Workplace")
+    Review = apps.get_model("workplaces", "Review")
+
+    workplaceIds = (
+        Review.objects.filter(deletedAt__isnull=True, verifiedBy__isnull=False)
+        .values_list("workplace_id", flat=True)
+        .distinct()
+    )
+    for workplaceId in workplaceIds:
+        reviews = Review.objects.filter(
+            workplace_id=workplaceId, deletedAt__isnull=True, verifiedBy__isnull=False
+        )
+        aggregates = reviews.aggregate(reviewCount=Count("pk"), starsSum=Sum("stars"))
+        Workplace.objects.filter(pk=workplaceId).update(
+            reviewCount=aggregates["reviewCount"],
+            starsSum=aggregates["starsSum"] or 0,
+            starsHistogram={
+                starOption: reviews.filter(stars=starOption).count()
+                for starOption in ["1", "2", "3", "4", "5"]
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workplaces", "0014_workplace_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workplace",
+            name="reviewCount",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="workplace",
+            name="starsHistogram",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="workplace",
+            name="starsSum",
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.RunPython(calculateReviewStats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:30
+
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def bucketHalfStarReviews(apps, schema_editor):
+    """
+    The histogram used to only count whole stars, so half star reviews were
+    missing from it. Recount it with half stars counted as the star below.
+    """
+    Workplace = apps.get_model("workplaces", "Workplace")
+    Review = apps.get_model("workplaces", "Review")
+
+    starBuckets = {
+        "1": Q(stars__lt=2),
+        "2": Q(stars__gte=2, stars__lt=3),
+        "3": Q(stars__gte=3, stars__lt=4),
+        "4": Q(stars__gte=4, stars__lt=5),
+        "5": Q(stars__gte=5),
+    }
+    histograms = (
+        Review.objects.filter(deletedAt__isnull=True, verifiedBy__isnull=False)
+        .values("workplace_id")
+        .annotate(
+            **{
+                f"stars{starOption}": Count("pk", filter=starFilter)
+                for starOption, starFilter in starBuckets.items()
+            }
+        )
+    )
+    for histogram in histograms:
+        Workplace.objects.filter(pk=histogram["workplace_id"]).update(
+            starsHistogram={
+                starOption: histogram[f"stars{starOption}"]
+                for starOption in starBuckets
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workplaces", "0015_workplace_review_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(bucketHalfStarReviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.3 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workplaces", "0016_bucket_half_star_reviews"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["workplace", "createdAt", "id"],
+                name="review_workplace_created_idx",
+            ),
+        ),
+    ]
@@ -1,6 +1,10 @@
+import threading
+import time
+
 from django.core.cache import cache
-from django.db import models
-from django.db.models.signals import pre_save
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import m2m_changed, post_delete
 from django.dispatch import receiver
 from users.models import BaseModel, User, randomColor
 
@@ -8,9 +12,18 @@ from users.models import BaseModel, User, randomColor
 class Category(BaseModel):
     name = models.CharField(max_length=255, unique=True)
 
+    trackedFields = ["name", "deletedAt"]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        changedFields = self.changedFields()
+        super().save(*args, **kwargs)
+        self.rememberTrackedFields()
+        if changedFields:
+            deleteCategoryCache()
+
 
 class TopCategory(BaseModel):
     name = models.CharField(max_length=255, unique=True)
@@ -21,9 +34,105 @@ class TopCategory(BaseModel):
         max_length=32, null=False, blank=False, default=randomColor
     )
 
+    trackedFields = ["name", "color", "deletedAt"]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        changedFields = self.changedFields()
+        super().save(*args, **kwargs)
+        self.rememberTrackedFields()
+        if changedFields:
+            deleteCategoryCache()
+
+
+class CategoryTree:
+    """
+    In-process map from each category to its top category, so serializers
+    can render the top category without a query per category.
+    Every process keeps its own copy, and reloads it when the version in the
+    cache has been bumped by a category change. Without a shared cache
+    backend, changes made in other processes don't bump this version, so the
+    copy is also reloaded once it is older than maxAge.
+    """
+
+    versionCacheKey = "workplace:categories:version"
+    # How long a process trusts its copy before checking the version again
+    versionCheckInterval = 5
+    # Seconds before the copy is reloaded anyway, like the categories
+    # response used to expire
+    maxAge = 60 * 10
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checkedAt = 0
+        self.loadedAt = None
+        self.topCategories = {}
+
+    def getTopCategory(self, category: Category):
+        self.refresh()
+        return self.topCategories.get(category.pk)
+
+    def refresh(self):
+        if time.monotonic() - self.checkedAt < self.versionCheckInterval:
+            return
+
+        with self.lock:
+            version = cache.get(self.versionCacheKey)
+            if version is None:
+                cache.add(self.versionCacheKey, 1, timeout=None)
+                version = cache.get(self.versionCacheKey)
+
+            expired = (
+                self.loadedAt is None or time.monotonic() - self.loadedAt > self.maxAge
+            )
+            if version != self.version or version is None or expired:
+                self.load()
+                self.version = version
+            self.checkedAt = time.monotonic()
+
+    def load(self):
+        topCategories = {
+            topCategory.pk: topCategory for topCategory in TopCategory.objects.all()
+        }
+        links = TopCategory.categories.through.objects.order_by(
+            "topcategory_id"
+        ).values_list("category_id", "topcategory_id")
+
+        # Like category.top_categories.first(), the top category with the
+        # lowest pk wins when a category has more than one
+        categoryTree = {}
+        for categoryId, topCategoryId in links:
+            categoryTree.setdefault(categoryId, topCategories[topCategoryId])
+        self.topCategories = categoryTree
+        self.loadedAt = time.monotonic()
+
+    def invalidate(self):
+        try:
+            cache.incr(self.versionCacheKey)
+        except ValueError:
+            cache.set(self.versionCacheKey, 1, timeout=None)
+        # This process reloads right away, the others on their next check
+        self.checkedAt = 0
+
+
+categoryTree = CategoryTree()
+
+
+STAR_OPTIONS = ["1", "2", "3", "4", "5"]
+
+# The reviews counted for each star option in the histogram. Half stars count
+# towards the star below them (3.5 is a 3), and anything below 2 is a 1.
+STAR_BUCKETS = {
+    "1": Q(stars__lt=2),
+    "2": Q(stars__gte=2, stars__lt=3),
+    "3": Q(stars__gte=3, stars__lt=4),
+    "4": Q(stars__gte=4, stars__lt=5),
+    "5": Q(stars__gte=5),
+}
+
 
 class Workplace(BaseModel):
     name = models.CharField(max_length=255, unique=True)
@@ -31,9 +140,70 @@ class Workplace(BaseModel):
     address = models.CharField(max_length=255, blank=True, null=True)
     categories = models.ManyToManyField(Category, related_name="workplaces", blank=True)
 
+    # Aggregates of the verified, not deleted reviews.
+    # Kept up to date whenever a review is saved or deleted.
+    reviewCount = models.PositiveIntegerField(default=0)
+    starsSum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    starsHistogram = models.JSONField(default=dict, blank=True)
+
     def __str__(self):
         return f"{self.name} - {self.vat}"
 
+    @property
+    def reviewsCacheGenerationKey(self):
+        return f"workplace:{self.pk}:reviews:generation"
+
+    def getReviewsCacheGeneration(self) -> int:
+        """
+        Returns the generation the cached review pages of the workplace are
+        stored under. Bumping it invalidates all of them at once.
+        """
+        generation = cache.get(self.reviewsCacheGenerationKey)
+        if generation is None:
+            # Start from the clock, so a generation that was evicted from the
+            # cache never comes back and serves the pages cached under it
+            cache.add(self.reviewsCacheGenerationKey, time.time_ns(), timeout=None)
+            generation = cache.get(self.reviewsCacheGenerationKey)
+        return generation
+
+    def bumpReviewsCacheGeneration(self):
+        try:
+            cache.incr(self.reviewsCacheGenerationKey)
+        except ValueError:
+            cache.add(self.reviewsCacheGenerationKey, time.time_ns(), timeout=None)
+
+    def refreshReviewStats(self):
+        """
+        Recalculates the review aggregates. The workplace row is locked while
+        doing so, so concurrent review changes can't overwrite each other.
+        """
+        with transaction.atomic():
+            Workplace.objects.select_for_update().filter(pk=self.pk).first()
+
+            reviews = Review.objects.filter(
+                workplace_id=self.pk, deletedAt__isnull=True, verifiedBy__isnull=False
+            )
+            aggregates = reviews.aggregate(
+                reviewCount=Count("pk"),
+                starsSum=Sum("stars"),
+                **{
+                    f"stars{starOption}": Count("pk", filter=STAR_BUCKETS[starOption])
+                    for starOption in STAR_OPTIONS
+                },
+            )
+
+            self.reviewCount = aggregates["reviewCount"]
+            self.starsSum = aggregates["starsSum"] or 0
+            self.starsHistogram = {
+                starOption: aggregates[f"stars{starOption}"]
+                for starOption in STAR_OPTIONS
+            }
+            Workplace.objects.filter(pk=self.pk).update(
+                reviewCount=self.reviewCount,
+                starsSum=self.starsSum,
+                starsHistogram=self.starsHistogram,
+            )
+
 
 class Review(BaseModel):
     stars = models.DecimalField(max_digits=2, decimal_places=1)
@@ -55,80 +225,66 @@ class Review(BaseModel):
         null=True,
     )
 
+    trackedFields = ["stars", "verifiedBy", "workplace", "deletedAt"]
+
+    class Meta:
+        indexes = [
+            # Serves the review lists, which page on (createdAt, id)
+            models.Index(
+                fields=["workplace", "createdAt", "id"],
+                name="review_workplace_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Review by {self.author} for {self.workplace}: {self.stars} stars"
 
-    def deleteCache(self):
-        workplace: Workplace = self.workplace
+    def save(self, *args, **kwargs):
+        changedFields = self.changedFields()
+        previousWorkplaceId = self.loadedValue("workplace")
 
-        cacheKeys = [
-            f"workplace:{workplace.pk}:AverageStars",
-            f"workplace:{workplace.pk}:amountOfReviews",
-            f"workplace:{workplace.pk}:reviews:page:1",
-            f"workplace:{workplace.pk}:starsProcentages",
-        ]
+        # The workplace review stats are updated in the same transaction as
+        # the review itself
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if changedFields:
+                self.workplace.refreshReviewStats()
+                transaction.on_commit(self.workplace.bumpReviewsCacheGeneration)
 
-        for cachekey in cacheKeys:
-            cache.delete(cachekey)
+                if previousWorkplaceId and previousWorkplaceId != self.workplace_id:
+                    previousWorkplace = Workplace(pk=previousWorkplaceId)
+                    previousWorkplace.refreshReviewStats()
+                    transaction.on_commit(previousWorkplace.bumpReviewsCacheGeneration)
 
+        self.rememberTrackedFields()
 
-@receiver(pre_save, sender=Category)
-@receiver(pre_save, sender=TopCategory)
-def deleteCacheOnCategoryChange(sender, instance=None, **kwargs):
-    if not instance.pk:
-        return
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
-    category = sender.objects.filter(pk=instance.pk).first()
-    if not category:
-        return
 
-    fields = [
-        "name",
-        "top_categories",
-        "categories",
-        "deletedAt",
-    ]
+@receiver(m2m_changed, sender=TopCategory.categories.through)
+def deleteCacheOnTopCategoryCategoriesChange(sender, action=None, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        deleteCategoryCache()
 
-    hasImportantChange = False
-    for field in fields:
-        try:
-            old_value = getattr(category, field)
-            new_value = getattr(instance, field)
-            if old_value != new_value:
-                hasImportantChange = True
-                break
-        except Exception:
-            continue
-
-    if hasImportantChange:
-        cacheKey = "workplace:categories"
-        cache.delete(cacheKey)
-
-
-@receiver(pre_save, sender=Review)
-def deleteCacheOnReviewChange(sender, instance=None, **kwargs):
-    if not instance.pk:
-        return
-
-    review = Review.objects.filter(pk=instance.pk).first()
-    if not review:
-        return
-
-    # Check for any changes in these fields
-    fields = [
-        "stars",
-        "verifiedBy",
-        "workplace",
-        "deletedAt",
-    ]
-    hasImportantChange = False
-    for field in fields:
-        old_value = getattr(review, field)
-        new_value = getattr(instance, field)
-        if old_value != new_value:
-            hasImportantChange = True
-            break
-
-    if hasImportantChange:
-        # Updating workplace stars
-        review.deleteCache()
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=TopCategory)
+def deleteCacheOnCategoryDelete(sender, instance=None, **kwargs):
+    deleteCategoryCache()
+
+
+def deleteCategoryCache():
+    cacheKey = "workplace:categories"
+    cache.delete(cacheKey)
+    # Other processes must not reload the tree before the change is committed
+    transaction.on_commit(categoryTree.invalidate)
+
+
+@receiver(post_delete, sender=Review)
+def updateReviewStatsOnReviewDelete(sender, instance=None, **kwargs):
+    workplace = Workplace.objects.filter(pk=instance.workplace_id).first()
+    if workplace:
+        workplace.refreshReviewStats()
+        transaction.on_commit(workplace.bumpReviewsCacheGeneration)
@@ -1,9 +1,14 @@
-from django.core.cache import cache
-from django.db.models import Avg
 from rest_framework import serializers
 from users.serializers import LightUserSerializer, UserSerializer
 
-from .models import Category, Review, TopCategory, Workplace
+from .models import (
+    STAR_OPTIONS,
+    Category,
+    Review,
+    TopCategory,
+    Workplace,
+    categoryTree,
+)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -19,7 +24,7 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
 
     def get_topCategory(self, obj: Category):
-        topCategory = obj.top_categories.first()
+        topCategory = categoryTree.getTopCategory(obj)
         if topCategory:
             return LightTopCategorySerializer(topCategory).data
         return None
@@ -83,62 +88,29 @@ class WorkplaceSerializer(serializers.ModelSerializer):
         ]
 
     def get_stars(self, obj: Workplace):
-        cacheKey = f"workplace:{obj.pk}:AverageStars"
-        cachedValue = cache.get(cacheKey)
-        if cachedValue is not None:
-            return cachedValue
-
-        reviews = obj.reviews.filter(
-            deletedAt__isnull=True, verifiedBy__isnull=False
-        ).aggregate(averageStars=Avg("stars"))
-        averageStars = reviews["averageStars"] or 0
+        averageStars = 0
+        if obj.reviewCount:
+            averageStars = obj.starsSum / obj.reviewCount
 
         # Rounding up
         averageStars = str(round(averageStars * 2) / 2)
-        cache.set(cacheKey, averageStars, timeout=900)
         return averageStars
 
     def get_starsProcentages(self, obj: Workplace):
-        cacheKey = f"workplace:{obj.pk}:starsProcentages"
-        cachedValue = cache.get(cacheKey)
-        if cachedValue is not None:
-            return cachedValue
-
         data = {}
-        totalReviews = obj.reviews.filter(
-            deletedAt__isnull=True, verifiedBy__isnull=False
-        ).count()
-
-        starOptions = [
-            "1",
-            "2",
-            "3",
-            "4",
-            "5",
-        ]
-        for starOption in starOptions:
+        totalReviews = obj.reviewCount
+
+        for starOption in STAR_OPTIONS:
             if totalReviews == 0:
                 data[starOption] = "0"
                 continue
 
-            count = obj.reviews.filter(
-                deletedAt__isnull=True, verifiedBy__isnull=False, stars=starOption
-            ).count()
+            count = obj.starsHistogram.get(starOption, 0)
             data[starOption] = str(round((count / totalReviews) * 100))
-        cache.set(cacheKey, data, timeout=60 * 15)  # Cache for 15 minutes
         return data
 
     def get_amountOfReviews(self, obj: Workplace):
-        cacheKey = f"workplace:{obj.pk}:amountOfReviews"
-        cachedValue = cache.get(cacheKey)
-        if cachedValue is not None:
-            return cachedValue
-
-        amountOfReviews = obj.reviews.filter(
-            deletedAt__isnull=True, verifiedBy__isnull=False
-        ).count()
-        cache.set(cacheKey, amountOfReviews, timeout=900)
-        return amountOfReviews
+        return obj.reviewCount
 
 
 class LightWorkplaceSerializer(WorkplaceSerializer):
@@ -155,6 +127,12 @@ class LightWorkplaceSerializer(WorkplaceSerializer):
         ]
 
 
+# What ReviewSerializer renders from related rows. Querysets of reviews that
+# are serialized should load these up front to avoid a query per review.
+REVIEW_RELATED_FIELDS = ["author", "workplace", "verifiedBy"]
+REVIEW_PREFETCH_FIELDS = ["author__schools"]
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     uuid = serializers.UUIDField(read_only=True, format="hex")
     createdAt = serializers.DateTimeField(read_only=True)
@@ -0,0 +1,69 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .utils import canLookupRemotely, createWorkplaceByVATNumber, searchTermCacheKey
+
+# How long a search term counts as in flight. It is released as soon as the
+# import finishes, this only guards against a crashed worker holding it.
+IMPORT_LOCK_TIMEOUT = 60
+
+importExecutor = ThreadPoolExecutor(
+    max_workers=settings.WORKPLACE_IMPORT_WORKERS,
+    thread_name_prefix="workplace-import",
+)
+
+
+def importLockKey(search: str) -> str:
+    return searchTermCacheKey("workplace:import", search)
+
+
+def runWorkplaceImport(search: str) -> bool:
+    """
+    Imports the workplaces laerepladsen has for the search term and releases
+    the in-flight lock for the term.
+    """
+    try:
+        return createWorkplaceByVATNumber(search)
+    except Exception as e:
+        from settings.middleware.error_handling import sendDiscordMessage
+
+        sendDiscordMessage(
+            "**Workplace import failed:**\n"
+            + str(e)
+            + "\nSearch: "
+            + search
+            + "\n\n*Traceback:* \n```"
+            + traceback.format_exc()
+            + "```"
+        )
+        return False
+    finally:
+        cache.delete(importLockKey(search))
+        if not settings.WORKPLACE_IMPORT_EAGER:
+            # Worker threads get their own connections, don't leave them open
+            connections.close_all()
+
+
+def enqueueWorkplaceImport(search: str) -> bool:
+    """
+    Queues a laerepladsen import for the search term without waiting for it.
+    Identical terms already in flight are not queued again, so a burst of the
+    same search only triggers one lookup.
+    Returns True if a new import was queued.
+    """
+    search = search.strip()
+    if not canLookupRemotely(search):
+        return False
+
+    if not cache.add(importLockKey(search), True, timeout=IMPORT_LOCK_TIMEOUT):
+        return False
+
+    if settings.WORKPLACE_IMPORT_EAGER:
+        runWorkplaceImport(search)
+    else:
+        importExecutor.submit(runWorkplaceImport, search)
+    return True
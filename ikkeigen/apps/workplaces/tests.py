@@ -1,3 +1,281 @@
-from django.test import TestCase
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from schools.models import School
+from users.models import User
+from users.utils import createJwtToken
+
+from .laerepladsen import CircuitOpenError, LaerepladsenClient
+from .models import Review, Workplace
+from .tasks import enqueueWorkplaceImport
+
+LAERESTED = {
+    "cvr": "12345678",
+    "navn": "Ikke Igen Tømrer ApS",
+    "adresse": "Hovedgaden 1, 1000 København",
+    "brancher": [{"tekst": "Tømrer"}],
+}
+
+
+class StubLaerepladsenHandler(BaseHTTPRequestHandler):
+    """
+    Answers with the next of the server's statuses, and LAERESTED as body.
+    """
+
+    def do_GET(self):
+        self.server.requestCount += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps({"laeresteder": [LAERESTED]}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LaerepladsenClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubLaerepladsenHandler)
+        self.server.statuses = []
+        self.server.requestCount = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def getClient(self, **kwargs) -> LaerepladsenClient:
+        host, port = self.server.server_address
+        return LaerepladsenClient(
+            f"http://{host}:{port}", timeout=2, backoffFactor=0, **kwargs
+        )
+
+    def test_server_errors_are_retried(self):
+        self.server.statuses = [503, 502]
+        client = self.getClient(retries=2)
+
+        self.assertEqual(client.search("Tømrer"), [LAERESTED])
+        self.assertEqual(self.server.requestCount, 3)
+        self.assertEqual(client.metrics.snapshot()["failures"], 0)
+
+    def test_circuit_opens_after_failure_threshold(self):
+        self.server.statuses = [500] * 3
+        client = self.getClient(retries=0, failureThreshold=3)
+
+        for _ in range(3):
+            with self.assertRaises(requests.RequestException):
+                client.search("Tømrer")
+
+        # Rejected during the cooldown without calling the upstream
+        with self.assertRaises(CircuitOpenError):
+            client.search("Tømrer")
+        self.assertEqual(self.server.requestCount, 3)
+
+        metrics = client.metrics.snapshot()
+        self.assertEqual(metrics["calls"], 3)
+        self.assertEqual(metrics["failures"], 3)
+        self.assertEqual(metrics["rejected"], 1)
+
+    def test_single_probe_after_cooldown(self):
+        self.server.statuses = [500]
+        client = self.getClient(retries=0, failureThreshold=1, cooldown=60)
+        with self.assertRaises(requests.RequestException):
+            client.search("Tømrer")
+
+        # The cooldown is over, the first call probes and the rest wait for it
+        client.circuitBreaker.openedAt -= 60
+        self.assertTrue(client.circuitBreaker.allowRequest())
+        self.assertFalse(client.circuitBreaker.allowRequest())
+
+        client.circuitBreaker.openedAt -= 60
+        self.assertEqual(client.search("Tømrer"), [LAERESTED])
+        self.assertEqual(self.server.requestCount, 2)
+
+        # The successful probe closes the circuit again
+        self.assertEqual(client.search("Tømrer"), [LAERESTED])
+        self.assertEqual(self.server.requestCount, 3)
+
+    def test_failed_probe_opens_circuit_again(self):
+        self.server.statuses = [500, 500]
+        client = self.getClient(retries=0, failureThreshold=1, cooldown=60)
+        with self.assertRaises(requests.RequestException):
+            client.search("Tømrer")
+
+        client.circuitBreaker.openedAt -= 60
+        with self.assertRaises(requests.RequestException):
+            client.search("Tømrer")
+
+        with self.assertRaises(CircuitOpenError):
+            client.search("Tømrer")
+        self.assertEqual(self.server.requestCount, 2)
+
+
+class WorkplaceImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Laerepladsen is never called for real from the tests
+        patcher = mock.patch("workplaces.utils.getLaerepladsenClient")
+        self.laerepladsen = patcher.start().return_value
+        self.laerepladsen.search.return_value = [LAERESTED]
+        self.addCleanup(patcher.stop)
+
+    def test_search_miss_imports_workplaces(self):
+        url = reverse("workplaces:search_workplaces")
+
+        response = self.client.get(url, {"search": "Ikke Igen Tømrer"})
+        self.assertEqual(response.data["count"], 0)
+        self.laerepladsen.search.assert_called_once_with("Ikke Igen Tømrer")
+
+        response = self.client.get(url, {"search": "Ikke Igen Tømrer"})
+        self.assertEqual(response.data["count"], 1)
+        self.assertTrue(Workplace.objects.filter(vat="12345678").exists())
+
+    @override_settings(WORKPLACE_IMPORT_EAGER=False)
+    def test_same_search_in_flight_is_queued_once(self):
+        with mock.patch("workplaces.tasks.importExecutor") as importExecutor:
+            self.assertTrue(enqueueWorkplaceImport("Ikke Igen Tømrer"))
+            self.assertFalse(enqueueWorkplaceImport("  ikke igen  tømrer "))
+            self.assertTrue(enqueueWorkplaceImport("Andet Firma"))
+
+        self.assertEqual(importExecutor.submit.call_count, 2)
+
+    def test_search_miss_is_not_looked_up_again(self):
+        self.laerepladsen.search.return_value = []
+
+        self.assertTrue(enqueueWorkplaceImport("Findes Ikke"))
+        self.assertFalse(enqueueWorkplaceImport("Findes Ikke"))
+        self.laerepladsen.search.assert_called_once()
+
+    def test_search_importing_nothing_is_not_looked_up_again(self):
+        # The name is taken, so the result is skipped on import
+        Workplace.objects.create(
+            name=LAERESTED["navn"], vat="87654321", address="Andenvej 2"
+        )
+
+        for _ in range(3):
+            self.client.get(
+                reverse("workplaces:search_workplaces"), {"search": "Snedker"}
+            )
+
+        self.laerepladsen.search.assert_called_once_with("Snedker")
+        self.assertFalse(Workplace.objects.filter(vat=LAERESTED["cvr"]).exists())
+
+
+class ReviewListQueryTests(TestCase):
+    """
+    A full page of reviews costs the same number of queries as a single one.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.school = School.objects.create(name="Skolen", address="Skolevej 1")
+        self.teacher = User.objects.create(
+            email="laerer@skolen.dk", isActive=True, role="teacher"
+        )
+        self.school.teachers.add(self.teacher)
+        self.workplace = Workplace.objects.create(
+            name="Værkstedet", vat="87654321", address="Værkstedsvej 2"
+        )
+
+        # Every review has its own author, so nothing is shared between rows
+        for index in range(15):
+            author = User.objects.create(email=f"elev{index}@skolen.dk", isActive=True)
+            self.school.students.add(author)
+            Review.objects.create(
+                stars=4,
+                title="Godt sted",
+                comment="Lærte meget",
+                author=author,
+                workplace=self.workplace,
+                verifiedBy=self.teacher,
+            )
+
+    def test_workplace_reviews_page(self):
+        url = reverse(
+            "workplaces:get_workplace_reviews",
+            kwargs={"workplaceUuid": self.workplace.uuid.hex},
+        )
+        # Workplace, count, page and the prefetched author schools
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 15)
+
+    def test_unverified_reviews_page(self):
+        Review.objects.update(verifiedBy=None)
+        token = Token.objects.create(user=self.teacher)
+        headers = {"HTTP_AUTHORIZATION": f"Token {createJwtToken(self.teacher, token)}"}
+        url = reverse("workplaces:get_unverified_reviews")
+
+        # Token with its user, the teacher's school, count, page and the
+        # prefetched author schools
+        with self.assertNumQueries(5):
+            response = self.client.get(url, **headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 15)
+
+
+class WorkplaceReviewsStarFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(email="elev@skolen.dk", isActive=True)
+        self.workplace = Workplace.objects.create(
+            name="Bageriet", vat="11223344", address="Bagervej 3"
+        )
+        for stars in ["3", "3.5", "4"]:
+            Review.objects.create(
+                stars=stars,
+                title="Anmeldelse",
+                comment="Kommentar",
+                author=author,
+                workplace=self.workplace,
+                verifiedBy=author,
+            )
+        self.url = reverse(
+            "workplaces:get_workplace_reviews",
+            kwargs={"workplaceUuid": self.workplace.uuid.hex},
+        )
+
+    def test_whole_stars_match_the_histogram(self):
+        self.workplace.refresh_from_db()
+        response = self.client.get(self.url, {"stars": "3"})
+
+        self.assertEqual(response.data["count"], self.workplace.starsHistogram["3"])
+        self.assertEqual(response.data["count"], 2)
+
+    def test_half_stars_match_exactly(self):
+        response = self.client.get(self.url, {"stars": "3.5"})
+        self.assertEqual(response.data["count"], 1)
+
+    def test_cursor_round_trip(self):
+        response = self.client.get(self.url, {"cursor": "", "page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(
+            self.url, {"cursor": response.data["next"], "page_size": 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_cursor_with_wrong_types_is_not_found(self):
+        # ["x", "x"] decodes fine but is neither a date nor an id
+        response = self.client.get(self.url, {"cursor": "WyJ4IiwgIngiXQ=="})
+        self.assertEqual(response.status_code, 404)
+
+    def test_last_page_is_not_cached_as_first_page(self):
+        response = self.client.get(self.url, {"page": "last", "page_size": 2})
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get(self.url, {"page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["previous"])
@@ -1,49 +1,222 @@
+import hashlib
+import re
+
 import requests
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Case, FloatField, Q, Value, When
 from django.db.models.query import QuerySet
 
+from workplaces.laerepladsen import getLaerepladsenClient
 from workplaces.models import Category, Workplace
 
+# How much a hit in each field counts towards the search rank.
+# Name hits outrank VAT hits, which outrank address hits.
+SEARCH_FIELD_WEIGHTS = {
+    "name": 1.0,
+    "vat": 0.8,
+    "address": 0.4,
+}
+
+# A danish CVR number, optionally prefixed with the DK country code
+CVR_PATTERN = re.compile(r"^(dk)?\d{8}$")
+
+
+def searchWorkplaces(search: str, queryset: QuerySet = None) -> QuerySet:
+    """
+    Returns the workplaces matching the search term, best matches first.
+    On Postgres the lookups are served by the trigram indexes and the name is
+    also matched by word similarity, so small typos still find the workplace.
+    Other databases (the SQLite test settings) only rank the substring hits.
+    """
+    if queryset is None:
+        queryset = Workplace.objects.filter(deletedAt__isnull=True)
+
+    search = search.strip()
+    if not search:
+        return queryset.order_by("name")
+
+    filter = Q()
+    rank = Value(0.0, output_field=FloatField())
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        fieldFilter = Q(**{f"{field}__icontains": search})
+        filter |= fieldFilter
+        rank = rank + Case(
+            When(fieldFilter, then=Value(weight)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    if connections[queryset.db].vendor == "postgresql":
+        filter |= Q(name__trigram_word_similar=search)
+        rank = rank + TrigramWordSimilarity(search, "name")
+
+    return (
+        queryset.filter(filter)
+        .annotate(searchRank=rank)
+        .order_by("-searchRank", "name")
+    )
+
+
+def normalizeSearchTerm(search: str) -> str:
+    """
+    Lowercases the search term and collapses its whitespace, so "  Smed  A/S"
+    and "smed a/s" count as the same search.
+    """
+    return " ".join(search.split()).lower()
+
+
+def searchTermCacheKey(prefix: str, search: str) -> str:
+    """
+    Returns a cache key for the normalized search term. The term is hashed as
+    it can contain characters that are not allowed in cache keys.
+    """
+    term = normalizeSearchTerm(search)
+    return f"{prefix}:{hashlib.sha1(term.encode('utf-8')).hexdigest()}"
+
+
+def lookupMissCacheKey(search: str) -> str:
+    return searchTermCacheKey("workplace:lookup:miss", search)
+
+
+def canLookupRemotely(search: str) -> bool:
+    """
+    Whether it is worth asking laerepladsen about the search term.
+    Numbers are only looked up when they are a complete CVR number, free text
+    needs a minimum length, and terms laerepladsen was recently asked about
+    are skipped until the negative cache expires.
+    """
+    term = normalizeSearchTerm(search)
+    compactTerm = term.replace(" ", "")
+    if compactTerm.removeprefix("dk").isdigit():
+        if not CVR_PATTERN.match(compactTerm):
+            return False
+    elif len(term) < settings.WORKPLACE_LOOKUP_MIN_LENGTH:
+        return False
+
+    return not cache.get(lookupMissCacheKey(term))
+
+
+def parseLaerested(laerested: dict) -> dict:
+    """
+    Maps a laerested from the laerepladsen API to our workplace fields.
+    """
+    vat = laerested.get("cvr")
+    categoryNames = []
+    for category in laerested.get("brancher") or []:
+        categoryName = category.get("tekst", "")
+        if categoryName and categoryName not in categoryNames:
+            categoryNames.append(categoryName)
+
+    return {
+        "vat": str(vat) if vat is not None else None,
+        "name": laerested.get("navn") or "",
+        "address": laerested.get("adresse") or "",
+        "categories": categoryNames,
+    }
+
+
+def getWorkplaceIds(keys: set[tuple]) -> dict[tuple, int]:
+    """
+    Returns the ids of the workplaces with the given (vat, address) keys.
+    """
+    vats = {vat for vat, address in keys if vat is not None}
+    vatFilter = Q(vat__in=vats)
+    if any(vat is None for vat, address in keys):
+        vatFilter |= Q(vat__isnull=True)
+
+    workplaces = Workplace.objects.filter(
+        vatFilter, address__in={address for vat, address in keys}
+    ).values_list("vat", "address", "id")
+    return {
+        (vat, address): workplaceId
+        for vat, address, workplaceId in workplaces
+        if (vat, address) in keys
+    }
+
+
+def importWorkplaces(laeresteder: list[dict]) -> int:
+    """
+    Creates the workplaces from laerepladsen we don't know yet, and sets the
+    categories of all of them. Everything is written with bulk queries in a
+    single transaction, so the query count doesn't grow with the row count.
+    Existing workplaces are matched on (vat, address) and otherwise left as is.
+    Returns the number of created workplaces.
+    """
+    rows = {}
+    for laerested in laeresteder:
+        row = parseLaerested(laerested)
+        rows.setdefault((row["vat"], row["address"]), row)
+
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        categoryNames = {name for row in rows.values() for name in row["categories"]}
+        Category.objects.bulk_create(
+            [Category(name=name) for name in categoryNames], ignore_conflicts=True
+        )
+        categoryIds = dict(
+            Category.objects.filter(name__in=categoryNames).values_list("name", "id")
+        )
+
+        existingIds = getWorkplaceIds(set(rows))
+        # Rows clashing with the name of another workplace are skipped by the
+        # conflict handling, as the name is unique
+        Workplace.objects.bulk_create(
+            [
+                Workplace(name=row["name"], vat=row["vat"], address=row["address"])
+                for key, row in rows.items()
+                if key not in existingIds
+            ],
+            ignore_conflicts=True,
+        )
+        workplaceIds = getWorkplaceIds(set(rows))
+
+        WorkplaceCategory = Workplace.categories.through
+        WorkplaceCategory.objects.filter(
+            workplace_id__in=workplaceIds.values()
+        ).delete()
+        WorkplaceCategory.objects.bulk_create(
+            [
+                WorkplaceCategory(
+                    workplace_id=workplaceId, category_id=categoryIds[categoryName]
+                )
+                for key, workplaceId in workplaceIds.items()
+                for categoryName in rows[key]["categories"]
+                if categoryName in categoryIds
+            ],
+            ignore_conflicts=True,
+        )
+
+    return len(workplaceIds) - len(existingIds)
+
 
 def createWorkplaceByVATNumber(vatNumber: str) -> None:
     """
     Returns a queryset of workplaces matching the given VAT number.
     """
     search = vatNumber.strip()
-    url = f"https://pms.laerepladsen.dk/api/soeg-opslag-kort/-1/-1?fritekst={search}&aftaleFilter=alle&medarbejdereFilter=alle&zoom=1&north=56.43007523471859&south=55.215764803933716&east=15.529157706956447&west=6.954356941849672"
+    if not canLookupRemotely(search):
+        return False
 
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        results = data.get("laeresteder", [])
+        results = getLaerepladsenClient().search(search)
+        # Its free text search matches rows ours doesn't, like the branch or
+        # workplaces skipped on import, so any answer is cached. Otherwise the
+        # term is looked up again on every search.
+        cache.set(
+            lookupMissCacheKey(search),
+            True,
+            timeout=settings.WORKPLACE_LOOKUP_MISS_TTL,
+        )
+        if not results:
+            return False
+
         maxResults = 15
         results = results[:maxResults]
-        createdNew = False
-
-        for workplace in results:
-            vat = workplace.get("cvr")
-            name = workplace.get("navn", "")
-            brancher = workplace.get("brancher", [])
-            address = workplace.get("adresse", "")
-
-            categories = []
-            for category in brancher:
-                categoryName = category.get("tekst", "")
-                if not categoryName:
-                    continue
-
-                categoryObj, created = Category.objects.get_or_create(name=categoryName)
-                categories.append(categoryObj)
-
-            workplaceObj, created = Workplace.objects.get_or_create(
-                vat=vat, address=address, defaults={"name": name}
-            )
-            workplaceObj.categories.set(categories)
-            workplaceObj.save()
-
-            if created:
-                createdNew = True
-        return createdNew
+        return importWorkplaces(results) > 0
     except (requests.RequestException, ValueError):
         return False
@@ -1,5 +1,7 @@
+from decimal import Decimal, InvalidOperation
+
 from django.core.cache import cache
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import status
@@ -7,17 +9,20 @@ from rest_framework.response import Response
 from schools.models import School
 from settings.middleware.error_handling import CustomAPIView
 from users.models import User
-from users.views import BasicPageination
+from users.views import BasicPageination, CachedCountPaginator
 
-from .models import Category, Review, TopCategory, Workplace
+from .models import STAR_BUCKETS, Category, Review, TopCategory, Workplace
 from .serializers import (
+    REVIEW_PREFETCH_FIELDS,
+    REVIEW_RELATED_FIELDS,
     CategorySerializer,
     LightWorkplaceSerializer,
     ReviewSerializer,
     TopCategorySerializer,
     WorkplaceSerializer,
 )
-from .utils import createWorkplaceByVATNumber
+from .tasks import enqueueWorkplaceImport
+from .utils import searchWorkplaces
 
 
 class SearchWorkPlacesView(CustomAPIView, BasicPageination):
@@ -28,34 +33,33 @@ class SearchWorkPlacesView(CustomAPIView, BasicPageination):
     """
 
     serializer_class = LightWorkplaceSerializer
+    django_paginator_class = CachedCountPaginator
     authentication_classes = []
     permission_classes = []
 
     def get(self, request, *args, **kwargs):
         search = request.GET.get("search", "")
 
-        filter = (
-            Q(name__icontains=search, deletedAt__isnull=True)
-            | Q(vat__icontains=search, deletedAt__isnull=True)
-            | Q(address__icontains=search, deletedAt__isnull=True)
-        )
-
+        queryset = Workplace.objects.filter(deletedAt__isnull=True)
         categoryUuid = request.GET.get("categoryUuid", None)
         if categoryUuid:
-            filter &= Q(categories__uuid=categoryUuid, deletedAt__isnull=True)
-
-        workplaces = Workplace.objects.filter(filter)
-
-        if not workplaces.exists():
-            createdNew = createWorkplaceByVATNumber(search)
-            if createdNew:
-                workplaces = Workplace.objects.filter(
-                    Q(name__icontains=search, deletedAt__isnull=True)
-                    | Q(vat__icontains=search, deletedAt__isnull=True)
-                    | Q(address__icontains=search, deletedAt__isnull=True)
+            # A subquery instead of a join keeps one row per workplace
+            queryset = queryset.filter(
+                Exists(
+                    Workplace.categories.through.objects.filter(
+                        workplace=OuterRef("pk"), category__uuid=categoryUuid
+                    )
                 )
+            )
 
+        workplaces = searchWorkplaces(search, queryset)
         paginated = self.paginate(workplaces, request)
+
+        if paginated.data["count"] == 0:
+            # Laerepladsen is looked up in the background, the workplaces it
+            # knows show up on the next search.
+            enqueueWorkplaceImport(search)
+
         return Response(data=paginated.data, status=status.HTTP_200_OK)
 
 
@@ -170,6 +174,7 @@ class GetUnverifiedReviewsView(CustomAPIView, BasicPageination):
 
     roleNeeded = ["teacher", "teacher-admin"]
     serializer_class = ReviewSerializer
+    cursorOrdering = ("createdAt", "id")
 
     def get(self, request, *args, **kwargs):
         school: School = request.user.teachingSchools.first()
@@ -178,9 +183,14 @@ class GetUnverifiedReviewsView(CustomAPIView, BasicPageination):
                 data={"detail": "Du har ikke tilladelse til at se anmeldelser."},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        reviews = Review.objects.filter(
-            verifiedBy__isnull=True, deletedAt__isnull=True, author__schools=school
-        ).order_by("createdAt")
+        reviews = (
+            Review.objects.filter(
+                verifiedBy__isnull=True, deletedAt__isnull=True, author__schools=school
+            )
+            .select_related(*REVIEW_RELATED_FIELDS)
+            .prefetch_related(*REVIEW_PREFETCH_FIELDS)
+            .order_by("createdAt")
+        )
 
         data = self.paginate(reviews, request).data
         return Response(data=data, status=status.HTTP_200_OK)
@@ -219,36 +229,73 @@ class GetWorkplaceReviewsView(CustomAPIView, BasicPageination):
     """
     <GET> returns a paginatied list of workplace reviews
     ?stars=<int>
+    ?cursor=<cursor> pages by cursor instead of page number
     """
 
     serializer_class = ReviewSerializer
+    cursorOrdering = ("-createdAt", "-id")
     authentication_classes = []
     permission_classes = []
 
     def get(self, request, *args, **kwargs):
-        stars = request.GET.get("stars", "all")
+        stars = request.GET.get("stars") or "all"
         workplaceUuid = kwargs.get("workplaceUuid")
         workplace = get_object_or_404(
             Workplace, uuid=workplaceUuid, deletedAt__isnull=True
         )
 
-        cacheKey = f"workplace:{workplace.pk}:reviews:page:1"
-        if stars == "all":
-            if self.getPageNumber(request) == 1:
-                cachedData = cache.get(cacheKey)
-                if cachedData:
-                    return Response(data=cachedData, status=status.HTTP_200_OK)
+        if stars != "all":
+            try:
+                stars = Decimal(stars).quantize(Decimal("0.1"))
+            except InvalidOperation:
+                stars = None
+
+            if stars is None or not stars.is_finite():
+                return Response(
+                    data={"detail": "Ugyldigt antal stjerner."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        # Every page is cached per star filter and page size, until a review
+        # change bumps the generation of the workplace
+        if self.usesCursor(request):
+            page = f"cursor:{request.query_params.get(self.cursor_query_param)}"
+        else:
+            # Only page numbers are cached, ?page=last is not the same page
+            # once more reviews are added
+            page = request.query_params.get(self.page_query_param, "1")
+            page = f"page:{page}" if page.isdecimal() else None
+
+        cacheKey = None
+        if page is not None:
+            cacheKey = (
+                f"workplace:{workplace.pk}:reviews:{workplace.getReviewsCacheGeneration()}"
+                f":stars:{stars}:{page}:size:{self.get_page_size(request)}"
+            )
+            cachedData = cache.get(cacheKey)
+            if cachedData is not None:
+                return Response(data=cachedData, status=status.HTTP_200_OK)
 
         filter = Q(
             workplace=workplace, deletedAt__isnull=True, verifiedBy__isnull=False
         )
-        if stars and stars != "all":
-            filter &= Q(stars=stars)
-
-        reviews = Review.objects.filter(filter).order_by("-createdAt")
+        if stars != "all":
+            starOption = str(int(stars))
+            if stars == int(stars) and starOption in STAR_BUCKETS:
+                # Whole stars match the histogram bucket, so 3 includes 3.5
+                filter &= STAR_BUCKETS[starOption]
+            else:
+                filter &= Q(stars=stars)
+
+        reviews = (
+            Review.objects.filter(filter)
+            .select_related(*REVIEW_RELATED_FIELDS)
+            .prefetch_related(*REVIEW_PREFETCH_FIELDS)
+            .order_by("-createdAt")
+        )
 
         paginated = self.paginate(reviews, request)
-        if self.getPageNumber(request) == 1 and stars == "all":
+        if cacheKey is not None:
             cache.set(cacheKey, paginated.data, timeout=60 * 10)  # Cache for 10 minutes
         return Response(data=paginated.data, status=status.HTTP_200_OK)
 
@@ -269,8 +316,10 @@ class GetCategoriesView(CustomAPIView, BasicPageination):
         if cachedData:
             return Response(data=cachedData, status=status.HTTP_200_OK)
 
-        categories = TopCategory.objects.filter(deletedAt__isnull=True).order_by(
-            "-name"
+        categories = (
+            TopCategory.objects.filter(deletedAt__isnull=True)
+            .prefetch_related("categories")
+            .order_by("-name")
         )
         serializer = self.serializer_class(categories, many=True)
 
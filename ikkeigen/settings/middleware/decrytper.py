@@ -14,6 +14,13 @@ from rest_framework.views import APIView
 
 BLOCK_SIZE = 128
 
+# The keys are loaded when the settings are, the padding is shared as well
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None,
+)
+
 
 def getSecret():
     return settings.DEFAULTSETTINGS.get("PRIVATE_KEY")
@@ -32,11 +39,7 @@ def encrypt_data(data):
 
     encryptedData = publicKey.encrypt(
         data,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None,
-        ),
+        OAEP_PADDING,
     )
     return base64.b64encode(encryptedData).decode("utf-8")
 
@@ -49,23 +52,26 @@ def decrypt_data(encryptedData):
     # Decrypt the data
     decryptedData = privateKey.decrypt(
         encryptedData,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None,
-        ),
+        OAEP_PADDING,
     )
     return decryptedData.decode("utf-8")  # Convert bytes to string if needed
 
 
 class RequestTimeLoggingMiddleware(APIView):
+    # Methods whose body may contain encryptedFields. Views that never get
+    # encrypted input can set it to an empty set, other methods never parse
+    # the body here.
+    encryptedInputMethods = frozenset(["POST", "PUT", "PATCH"])
+
     def initial(self, request, *args, **kwargs):
         super().initial(request, *args, **kwargs)
 
-        if not hasattr(request, "data"):
-            return self.get_response(request)
+        if request.method not in self.encryptedInputMethods:
+            return
 
         data = request.data
+        if not hasattr(data, "get"):
+            return
         encryptedFields = data.get("encryptedFields")
         if encryptedFields and len(encryptedFields) > 0:
             try:
@@ -50,10 +50,15 @@ class CustomAPIView(UserPermissions, RequestTimeLoggingMiddleware):
     roleNeeded = None
     noPermissionForMethods = []
 
-    def __init__(self, **kwargs) -> None:
-        if self.authenticationRequired == False:
-            self.permission_classes = ()
-        super().__init__(**kwargs)
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Resolved once per view class instead of on every request
+        if not cls.authenticationRequired:
+            cls.permission_classes = ()
+        cls.authenticators = tuple(
+            auth(authenticationRequired=cls.authenticationRequired)
+            for auth in cls.authentication_classes
+        )
 
     @property
     def language(self):
@@ -80,12 +85,10 @@ class CustomAPIView(UserPermissions, RequestTimeLoggingMiddleware):
 
     def get_authenticators(self):
         """
-        Instantiates and returns the list of authenticators that this view can use.
+        Returns the list of authenticators that this view can use. They keep no
+        state between requests, so they are created once per view class.
         """
-        return [
-            auth(authenticationRequired=self.authenticationRequired)
-            for auth in self.authentication_classes
-        ]
+        return list(self.authenticators)
 
 
 class CustomUpdateAPIView(UpdateAPIView, CustomAPIView):
@@ -167,6 +167,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "djangoql",
     "django_extensions",
@@ -312,6 +313,54 @@ EMAIL_USE_TLS = (
 )  # STARTTLS (common on 587)
 EMAIL_USE_SSL = os.environ.get("EMAIL_USE_SSL", "False") == "True"  # only if using 465
 EMAIL_TIMEOUT = int(os.environ.get("EMAIL_TIMEOUT", 10))
+# Emails are queued in the OutgoingEmail table and sent by the sendemails
+# worker. Eager sends them right away instead, the school invite tests use
+# it to check the sent mail.
+EMAIL_OUTBOX_EAGER = os.environ.get("EMAIL_OUTBOX_EAGER", "False") == "True"
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+# Seconds before the first retry, doubled for every failed attempt
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get("EMAIL_OUTBOX_RETRY_DELAY", 60))
+
+
+# The laerepladsen API workplaces are looked up in
+LAEREPLADSEN_BASE_URL = os.environ.get(
+    "LAEREPLADSEN_BASE_URL", "https://pms.laerepladsen.dk"
+)
+LAEREPLADSEN_TIMEOUT = int(os.environ.get("LAEREPLADSEN_TIMEOUT", 5))
+LAEREPLADSEN_POOL_SIZE = int(os.environ.get("LAEREPLADSEN_POOL_SIZE", 10))
+LAEREPLADSEN_RETRIES = int(os.environ.get("LAEREPLADSEN_RETRIES", 2))
+# After this many failed calls in a row laerepladsen is left alone for the
+# cooldown (seconds)
+LAEREPLADSEN_CIRCUIT_FAILURES = 5
+LAEREPLADSEN_CIRCUIT_COOLDOWN = 60
+
+# Workplaces missing from a search are imported from laerepladsen in the
+# background. Eager runs the import inline, which the workplace tests rely
+# on. They stub the laerepladsen client, so no real calls are made.
+WORKPLACE_IMPORT_EAGER = os.environ.get("WORKPLACE_IMPORT_EAGER", "False") == "True"
+WORKPLACE_IMPORT_WORKERS = int(os.environ.get("WORKPLACE_IMPORT_WORKERS", 2))
+# Search terms laerepladsen has been asked about are not looked up again
+# until the negative cache expires (seconds), also when nothing was imported.
+WORKPLACE_LOOKUP_MISS_TTL = int(os.environ.get("WORKPLACE_LOOKUP_MISS_TTL", 60 * 60))
+WORKPLACE_LOOKUP_MIN_LENGTH = 3
+
+# Lists using CachedCountPaginator cache their counts (seconds), and use the
+# planner estimate instead of counting above the threshold (rows).
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.environ.get("PAGINATION_COUNT_CACHE_TIMEOUT", 60)
+)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.environ.get("PAGINATION_COUNT_ESTIMATE_THRESHOLD", 10000)
+)
+
+# Authenticated users are cached per token for this long (seconds). Changes
+# to the user or token clear the cache, the timeout bounds how long processes
+# with their own local cache can serve a stale user.
+AUTHENTICATION_CACHE_TIMEOUT = int(os.environ.get("AUTHENTICATION_CACHE_TIMEOUT", 60))
+# Stateless mode verifies jwts against the token version of the user instead
+# of their Token row, logging out bumps the version.
+JWT_STATELESS = os.environ.get("JWT_STATELESS", "False") == "True"
 
 
 DEFAULT_FROM_EMAIL = "no-reply@ikkeigen.dk"
@@ -1,3 +1,6 @@
 from .settings import *
 
 DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3"}}
+
+WORKPLACE_IMPORT_EAGER = True
+EMAIL_OUTBOX_EAGER = True